@@ -0,0 +1,152 @@
+"""
+synthetic courses in the layout `parser.get_course` expects
+`<course>/<week>/<week item>/<file>.en.srt|.html`
+"""
+
+import os
+import random
+import shutil
+from dataclasses import dataclass
+
+WORDS = (
+    "python function variable loop list dictionary class object method module "
+    "import return value string number expression statement condition branch "
+    "recursion algorithm data structure tree graph search sort index slice "
+    "iterator generator exception error test debug program compute result"
+).split()
+
+
+@dataclass
+class CourseShape:
+    weeks: int = 4
+    items: int = 3
+    files: int = 4
+    file_kb: int = 8
+    # share of lecture transcripts repeating an earlier one, like recap videos
+    duplicates: float = 0.0
+
+    @property
+    def total_files(self) -> int:
+        return self.weeks * self.items * self.files
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(6, 16))
+    return " ".join(words).capitalize() + "."
+
+
+def _format_time(seconds: float) -> str:
+    millis = int(seconds * 1000)
+    return (
+        f"{millis // 3600000:02d}:{millis // 60000 % 60:02d}:"
+        f"{millis // 1000 % 60:02d},{millis % 1000:03d}"
+    )
+
+
+def _write_srt(path: str, rng: random.Random, size: int):
+    """
+    like auto-generated captions, cues are fragments of a few words which cut
+    sentences anywhere, with a pause now and then
+    """
+    with open(path, "w") as f:
+        cue = 0
+        time = 0.0
+        words = []
+        while f.tell() < size:
+            if len(words) < 10:
+                words.extend(_sentence(rng).split())
+            count = rng.randint(4, 9)
+            text, words = " ".join(words[:count]), words[count:]
+            duration = count * 0.4
+            f.write(
+                f"{cue + 1}\n"
+                f"{_format_time(time)} --> {_format_time(time + duration)}\n"
+                f"{text}\n\n"
+            )
+            cue += 1
+            time += duration + (3.0 if rng.random() < 0.05 else 0.1)
+
+
+def _write_html(path: str, rng: random.Random, size: int, title: str):
+    with open(path, "w") as f:
+        f.write(f"<html><head><title>{title}</title></head><body><h1>{title}</h1>")
+        section = 0
+        while f.tell() < size:
+            if section % 4 == 0:
+                f.write(f"<h2>Section {section // 4 + 1}</h2>")
+            paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+            f.write(f"<p>{paragraph}</p>")
+            section += 1
+        f.write("</body></html>")
+
+
+def _write_quiz_html(path: str, rng: random.Random, size: int, title: str):
+    """
+    like a saved quiz page, the questions sit between inline styles, scripts,
+    navigation and deeply nested markup
+    """
+    with open(path, "w") as f:
+        f.write(
+            f"<!DOCTYPE html><html><head><title>{title}</title>"
+            "<style>.option{margin:4px}.question{padding:8px}</style>"
+            '<script>window.__STATE__={"quiz":true,"items":[1,2,3]};</script>'
+            '</head><body><nav><ul><li><a href="/">Home</a></li>'
+            '<li><a href="/grades">Grades</a></li></ul></nav>'
+            f"<main><h1>{title}</h1>"
+        )
+        question = 0
+        while f.tell() < size:
+            question += 1
+            f.write(
+                f'<div class="question"><div class="rc-FormPart"><h3>Question '
+                f"{question}</h3><div><p>{_sentence(rng)}</p></div><form>"
+            )
+            for option in range(4):
+                f.write(
+                    f'<div class="option"><label><input type="radio" '
+                    f'name="q{question}" value="{option}"><span>'
+                    f"<span>{_sentence(rng)}</span></span></label></div>"
+                )
+            f.write(
+                f"</form></div><script>track('question-{question}');</script></div>"
+            )
+        f.write("</main><footer>Coursera</footer></body></html>")
+
+
+def make_course(root: str, name: str, shape: CourseShape, seed: int = 0) -> str:
+    """
+    write a course of transcripts and notes, the same seed writes the same course
+    :return: path of the course
+    """
+    rng = random.Random(seed)
+    course_path = f"{root}/{name}"
+    size = shape.file_kb * 1024
+    lectures = []
+    for week in range(shape.weeks):
+        for item in range(shape.items):
+            folder = (
+                f"{course_path}/{week + 1:02d}_week-{week + 1}"
+                f"/{item + 1:02d}_lesson-{week + 1}-{item + 1}"
+            )
+            os.makedirs(folder, exist_ok=True)
+            for file in range(shape.files):
+                # alternate lecture transcripts and reading notes
+                if file % 2 == 0:
+                    path = f"{folder}/{file + 1:02d}_lecture.en.srt"
+                    if (
+                        shape.duplicates
+                        and lectures
+                        and rng.random() < shape.duplicates
+                    ):
+                        shutil.copyfile(rng.choice(lectures), path)
+                    else:
+                        _write_srt(path, rng, size)
+                    lectures.append(path)
+                else:
+                    _write_html(
+                        f"{folder}/{file + 1:02d}_reading.html",
+                        rng,
+                        size,
+                        f"Reading {week + 1}.{item + 1}.{file + 1}",
+                    )
+    return course_path
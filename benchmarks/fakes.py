@@ -0,0 +1,105 @@
+"""
+deterministic fake chat and embedding models with injectable latency
+- requests go through the process-wide scheduler like OpenAI requests do
+- answers only depend on the prompt, so runs are repeatable
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.rag.context import count_tokens
+from src.rag.scheduler import get_scheduler
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    answer every prompt with a markdown list of `fanout` items and `words` words of
+    filler, TOCs fan out into `fanout` weeks, week items and key points
+    """
+
+    latency: float = 0.0
+    fanout: int = 3
+    words: int = 200
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+        lines = [f"- topic {digest} {i + 1}" for i in range(self.fanout)]
+        filler = " ".join(f"word{i % 97}" for i in range(self.words))
+        text = "\n".join(lines) + f"\n\n{filler}\n"
+        usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "completion_tokens": count_tokens(text),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"token_usage": usage, "model_name": self.model_name},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        def generate(slot):
+            time.sleep(self.latency)
+            return self._answer(messages)
+
+        return get_scheduler().call(generate)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        async def agenerate(slot):
+            await asyncio.sleep(self.latency)
+            return self._answer(messages)
+
+        return await get_scheduler().acall(agenerate)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    unit vectors seeded by the text, `latency` seconds per request
+    """
+
+    def __init__(self, size: int = 1536, latency: float = 0.0) -> None:
+        self.size = size
+        self.latency = latency
+        self.model = f"fake-embedding-{size}"
+        self.texts = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.texts += len(texts)
+            self.requests += 1
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.size)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return self._embed(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return self._embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,130 @@
+"""
+benchmark of the native `.srt` and `.html` readers against LangChain's `SRTLoader`
+and `BSHTMLLoader` with the text splitter, on course files or on synthetic ones
+
+usage: uv run python -m benchmarks.loaders [--kind srt|html] [--path <courses folder>]
+"""
+
+import argparse
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from rich.table import Table
+
+from benchmarks.course import _write_quiz_html, _write_srt
+from src.config import html_config, srt_config
+from src.log import rich_print
+from src.rag.loader import get_documents
+
+# the switch of the native reader of every kind of file
+NATIVE_CONFIGS = {"srt": srt_config, "html": html_config}
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="benchmark of the file readers")
+    parser.add_argument("--kind", choices=sorted(NATIVE_CONFIGS), default="srt")
+    parser.add_argument(
+        "--path", help="folder searched for the files, synthetic files otherwise"
+    )
+    parser.add_argument("--files", type=int, default=50, help="synthetic files")
+    parser.add_argument("--file-kb", type=int, default=32, help="synthetic file size")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per reader, the best one counts"
+    )
+    return parser.parse_args()
+
+
+def _make_files(folder: str, kind: str, files: int, file_kb: int) -> list[str]:
+    rng = random.Random(0)
+    paths = []
+    for index in range(files):
+        if kind == "srt":
+            path = f"{folder}/{index:03d}_lecture.en.srt"
+            _write_srt(path, rng, file_kb * 1024)
+        else:
+            path = f"{folder}/{index:03d}_quiz.html"
+            _write_quiz_html(path, rng, file_kb * 1024, f"Quiz {index + 1}")
+        paths.append(path)
+    return paths
+
+
+def _get_peak_mb(paths: list[str]) -> float:
+    """
+    the highest memory allocated while reading one file, traced apart from the
+    timed runs since tracing slows them down
+    """
+    peak = 0
+    tracemalloc.start()
+    try:
+        for path in paths:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            get_documents(path)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def _measure(
+    paths: list[str], kind: str, native: bool, repeat: int
+) -> dict[str, float]:
+    NATIVE_CONFIGS[kind].NATIVE = native
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        chunks = [chunk for path in paths for chunk in get_documents(path)]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    size = sum(os.path.getsize(path) for path in paths)
+    chars = sum(len(chunk.page_content) for chunk in chunks)
+    return {
+        "seconds": best,
+        "files_per_sec": len(paths) / best,
+        "mb_per_sec": size / 1024 / 1024 / best,
+        "peak_file_mb": _get_peak_mb(paths),
+        "chunks": len(chunks),
+        "chars_per_chunk": chars / max(1, len(chunks)),
+    }
+
+
+def main() -> int:
+    args = _get_args()
+    with tempfile.TemporaryDirectory(prefix="coursera-loaders-") as folder:
+        if args.path:
+            paths = sorted(glob.glob(f"{args.path}/**/*.{args.kind}", recursive=True))
+        else:
+            paths = _make_files(folder, args.kind, args.files, args.file_kb)
+        if not paths:
+            rich_print(f"[red]No .{args.kind} files found in {args.path}[/red]")
+            return 1
+        rich_print(f"Reading [bold]{len(paths)}[/bold] .{args.kind} files")
+        config = NATIVE_CONFIGS[args.kind]
+        native = config.NATIVE
+        try:
+            langchain = _measure(paths, args.kind, native=False, repeat=args.repeat)
+            native_results = _measure(paths, args.kind, native=True, repeat=args.repeat)
+        finally:
+            config.NATIVE = native
+
+    table = Table(title=f"{args.kind.upper()} reading")
+    table.add_column("Metric")
+    table.add_column("LangChain + splitter", justify="right")
+    table.add_column("Native", justify="right")
+    table.add_column("Change", justify="right")
+    for name, value in langchain.items():
+        change = (native_results[name] - value) / value if value else 0.0
+        table.add_row(
+            name, f"{value:.2f}", f"{native_results[name]:.2f}", f"{change:+.1%}"
+        )
+    rich_print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+offline benchmark of `load` and `generate`
+- a synthetic course is loaded and summarized by `CourseAgent` end to end
+- OpenAI is replaced by fake models with injectable latency, Chroma by the NumPy store
+- results are compared to `benchmarks/baseline.json`, regressions exit with status 1
+
+usage: uv run python -m benchmarks.run [--weeks 4 --items 3 --files 4 --file-kb 8]
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from rich.table import Table
+
+from benchmarks.course import CourseShape, make_course
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from src.config import (
+    cache_config,
+    coursera_config,
+    numpy_store_config,
+    runtime_config,
+)
+from src.enums import AlgorithmEnum, StorageEnum
+from src.log import rich_print
+from src.rag.core import set_llm_factory
+from src.rag.embedding import set_embedding_factory
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+COURSE_NAME = "benchmark-course"
+
+# metrics where a higher value is better, the others are better lower
+HIGHER_IS_BETTER = {"files_per_sec", "chunks_per_sec", "slides_per_min"}
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="offline benchmark of load and generate"
+    )
+    parser.add_argument("--weeks", type=int, default=4, help="weeks of the course")
+    parser.add_argument("--items", type=int, default=3, help="items per week")
+    parser.add_argument("--files", type=int, default=4, help="files per week item")
+    parser.add_argument("--file-kb", type=int, default=8, help="size of each file")
+    parser.add_argument(
+        "--duplicates",
+        type=float,
+        default=0.0,
+        help="share of lecture transcripts repeating an earlier one",
+    )
+    parser.add_argument(
+        "--algorithm",
+        choices=[algorithm.value for algorithm in AlgorithmEnum],
+        default=AlgorithmEnum.RAG.value,
+    )
+    parser.add_argument(
+        "--async-generate", action=argparse.BooleanOptionalAction, default=True
+    )
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument(
+        "--fanout", type=int, default=3, help="items of every fake TOC answer"
+    )
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.05, help="seconds per chat request"
+    )
+    parser.add_argument(
+        "--embedding-latency",
+        type=float,
+        default=0.02,
+        help="seconds per embedding request",
+    )
+    parser.add_argument("--embedding-size", type=int, default=1536)
+    parser.add_argument(
+        "--skip-generate", action="store_true", help="only benchmark load"
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="baseline file to compare with"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the baseline of this scenario",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="relative change reported as a regression, default is 0.15",
+    )
+    parser.add_argument(
+        "--workdir", help="keep the course and outputs here instead of a temp folder"
+    )
+    return parser.parse_args()
+
+
+def _get_scenario(args: argparse.Namespace) -> str:
+    """
+    results are only comparable with a baseline of the same scenario
+    """
+    mode = "async" if args.async_generate else "sync"
+    scenario = (
+        f"{args.algorithm}-{mode}-w{args.weeks}-i{args.items}-f{args.files}"
+        f"-{args.file_kb}kb-fanout{args.fanout}-llm{args.llm_latency}"
+        f"-emb{args.embedding_latency}-c{args.max_concurrency}"
+    )
+    if args.duplicates:
+        scenario += f"-dup{args.duplicates}"
+    return scenario
+
+
+def _get_peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _configure(args: argparse.Namespace, workdir: str):
+    coursera_config.INPUT_ROOT_FOLDER = f"{workdir}/input"
+    coursera_config.RESULT_ROOT_FOLDER = f"{workdir}/output"
+    # a cold run, every chunk is embedded and every prompt is answered
+    cache_config.FOLDER = f"{workdir}/cache"
+    cache_config.EMBEDDING_CACHE = False
+    cache_config.LLM_CACHE = False
+    numpy_store_config.FOLDER = f"{workdir}/numpy"
+    runtime_config.ALGORITHM = args.algorithm
+    runtime_config.STORAGE = StorageEnum.NUMPY
+    runtime_config.ASYNC_GENERATE = args.async_generate
+    runtime_config.MAX_CONCURRENCY = max(1, args.max_concurrency)
+
+
+def run_benchmark(args: argparse.Namespace, workdir: str) -> dict[str, float]:
+    _configure(args, workdir)
+    shape = CourseShape(
+        weeks=args.weeks,
+        items=args.items,
+        files=args.files,
+        file_kb=args.file_kb,
+        duplicates=args.duplicates,
+    )
+    make_course(coursera_config.INPUT_ROOT_FOLDER, COURSE_NAME, shape)
+
+    embeddings = FakeEmbeddings(
+        size=args.embedding_size, latency=args.embedding_latency
+    )
+    set_embedding_factory(lambda: embeddings)
+    set_llm_factory(
+        lambda **kwargs: FakeChatModel(
+            latency=args.llm_latency, fanout=args.fanout, **kwargs
+        )
+    )
+
+    # imported late, the algorithms read the configuration when they are created
+    from src.service import CourseAgent
+
+    results = {}
+    agent = CourseAgent(course_name=COURSE_NAME)
+    try:
+        if args.algorithm == AlgorithmEnum.RAG.value:
+            start = time.perf_counter()
+            agent.load_course()
+            elapsed = time.perf_counter() - start
+            results["load_seconds"] = elapsed
+            results["files_per_sec"] = shape.total_files / elapsed
+            results["chunks_per_sec"] = embeddings.texts / elapsed
+            results["chunks"] = embeddings.texts
+
+        if not args.skip_generate:
+            start = time.perf_counter()
+            agent.summarize_course()
+            elapsed = time.perf_counter() - start
+            course_result = agent.get_summarize_course_result()
+            slides = sum(
+                key_point.type != "error"
+                for week in course_result.weeks
+                for item in week.items
+                for key_point in item.items
+            )
+            results["generate_seconds"] = elapsed
+            results["slides"] = slides
+            results["slides_per_min"] = slides / elapsed * 60
+    finally:
+        agent.close()
+        set_llm_factory(None)
+        set_embedding_factory(None)
+    results["peak_rss_mb"] = _get_peak_rss_mb()
+    return results
+
+
+def _load_baselines(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float] | None, tolerance: float
+) -> list[str]:
+    """
+    print the results next to the baseline
+    :return: names of the regressed metrics
+    """
+    table = Table(title="Benchmark")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Change", justify="right")
+    regressions = []
+    for name, value in results.items():
+        base = (baseline or {}).get(name)
+        if not base:
+            table.add_row(name, f"{value:.2f}", "", "")
+            continue
+        change = (value - base) / base
+        worse = -change if name in HIGHER_IS_BETTER else change
+        color = "white"
+        # counts and seconds are informative, the rates and the memory are checked
+        if name in HIGHER_IS_BETTER or name == "peak_rss_mb":
+            if worse > tolerance:
+                color = "red"
+                regressions.append(name)
+            elif worse < -tolerance:
+                color = "green"
+        table.add_row(
+            name, f"{value:.2f}", f"{base:.2f}", f"[{color}]{change:+.1%}[/{color}]"
+        )
+    rich_print(table)
+    return regressions
+
+
+def main() -> int:
+    args = _get_args()
+    scenario = _get_scenario(args)
+    rich_print(f"Benchmark scenario: [bold]{scenario}[/bold]")
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmark(args, args.workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="coursera-benchmark-") as workdir:
+            results = run_benchmark(args, workdir)
+
+    baselines = _load_baselines(args.baseline)
+    if scenario not in baselines:
+        rich_print(
+            f"[yellow]No baseline for this scenario in {args.baseline}, "
+            "store one with --save-baseline[/yellow]"
+        )
+    regressions = compare(results, baselines.get(scenario), args.tolerance)
+
+    if args.save_baseline:
+        baselines[scenario] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        rich_print(f"Baseline stored in [bold]{args.baseline}[/bold]")
+    elif regressions:
+        rich_print(f"[red]Regressed: {', '.join(regressions)}[/red]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+streaming aggregation of the final markdown deck
+"""
+
+import os
+import shutil
+import threading
+
+from src.log import get_logger
+
+# marks the start of a week in the deck, the renderer splits the deck on it
+PART_MARKER = "<!-- part: {name} -->"
+
+
+class StreamingAggregator:
+    """
+    append slides to the final deck in document order, as soon as a slide and every
+    slide before it are done
+    - slots are reserved in document order, and completed in any order
+    - the deck is written to `partial_file_path` during the run, so it can be previewed,
+      and moved to `final_file_path` by `close`
+    """
+
+    def __init__(self, final_file_path: str) -> None:
+        self.final_file_path = final_file_path
+        root, ext = os.path.splitext(final_file_path)
+        self.partial_file_path = f"{root}.partial{ext}"
+        # each slot is `None` while pending, then `(text, path)`
+        self._slots: list[tuple[str | None, str | None] | None] = []
+        self._flushed = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(final_file_path) or ".", exist_ok=True)
+        self._file = open(self.partial_file_path, "w")
+
+    def add_text(self, text: str):
+        with self._lock:
+            self._slots.append((text, None))
+            self._flush()
+
+    def add_part(self, name: str):
+        """
+        start a new part of the deck, rendered on its own
+        """
+        self.add_text(PART_MARKER.format(name=name) + "\n\n")
+
+    def reserve(self) -> int:
+        """
+        reserve the next slot for a slide which is not done yet
+        """
+        with self._lock:
+            self._slots.append(None)
+            return len(self._slots) - 1
+
+    def complete(self, slot: int, path: str | None):
+        """
+        fill a reserved slot with the slide at `path`, `None` leaves the slot empty
+        """
+        with self._lock:
+            self._slots[slot] = (None, path)
+            self._flush()
+
+    def add_file(self, path: str | None):
+        self.complete(self.reserve(), path)
+
+    def _flush(self):
+        while self._flushed < len(self._slots) and self._slots[self._flushed]:
+            text, path = self._slots[self._flushed]
+            if text is not None:
+                self._file.write(text)
+            if path is not None:
+                # copy in blocks instead of reading the whole slide into memory
+                with open(path, "r") as slide_file:
+                    shutil.copyfileobj(slide_file, self._file)
+                self._file.write("\n\n")
+            # release the slot, it is never read again
+            self._slots[self._flushed] = (None, None)
+            self._flushed += 1
+        self._file.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._slots) - self._flushed
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            if self._flushed < len(self._slots):
+                get_logger().warning(
+                    f"{len(self._slots) - self._flushed} slides were never completed, "
+                    f"the partial deck is kept at {self.partial_file_path}"
+                )
+                return
+            os.replace(self.partial_file_path, self.final_file_path)
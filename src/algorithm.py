@@ -1,5 +1,11 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator
 import os
+import time
+
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
 
 from src.schema import (
     Course,
@@ -12,6 +18,17 @@ from src.schema import (
     KeyPoint,
 )
 from src.log import get_logger, rich_print
+from src.aggregator import StreamingAggregator
+from src.checkpoint import Checkpoint
+from src.config import runtime_config
+
+
+@dataclass
+class StreamMetric:
+    name: str
+    time_to_first_token: float
+    elapsed: float
+    chars: int
 
 
 class BaseAlgorithm(ABC):
@@ -19,6 +36,9 @@ class BaseAlgorithm(ABC):
     course_result: CourseResult | None = None
     dist_dir: str | None = None
     final_file_path: str | None = None
+    checkpoint: Checkpoint | None = None
+    aggregator: StreamingAggregator | None = None
+    progress: Progress | None = None
     logger = get_logger()
 
     def __init__(
@@ -27,17 +47,48 @@ class BaseAlgorithm(ABC):
         self.course_source = course_source
         self.dist_dir = dist_dir
         self.final_file_path = final_file_path
+        self.checkpoint = Checkpoint.load(dist_dir)
+        self.stream_metrics: list[StreamMetric] = []
 
     def summarize_course(self):
         """
-        Summarize the course and store the result in `course_result`
+        Summarize the course and store the result in `course_result`,
+        slides are appended to the final deck while they are generated
         """
-        self._generate_course()
+        self.aggregator = StreamingAggregator(self.final_file_path)
+        rich_print(
+            f"Partial deck is written to: [bold]{self.aggregator.partial_file_path}"
+        )
+        # add slide title
+        self.aggregator.add_text(f"# {self.course_source.name}\n\n---\n\n")
+        try:
+            if runtime_config.STREAM:
+                with Progress(
+                    SpinnerColumn(),
+                    TextColumn("{task.description}"),
+                    TimeElapsedColumn(),
+                    transient=True,
+                ) as progress:
+                    self.progress = progress
+                    self._generate_course()
+                self.progress = None
+                self._print_stream_metrics()
+            else:
+                self._generate_course()
+        finally:
+            # the last changes of the checkpoint, also when the run is interrupted
+            self.checkpoint.save()
         self._aggregate_course()
 
     def get_summarize_course_result(self) -> CourseResult:
         return self.course_result
 
+    def close(self) -> None:
+        """
+        release clients held for the whole process
+        """
+        pass
+
     @abstractmethod
     def load_course(self) -> None:
         pass
@@ -65,6 +116,7 @@ class BaseAlgorithm(ABC):
         )
 
     def _generate_week(self, course_week: CourseWeek) -> CourseWeekResult:
+        self._aggregate_week_header(course_week.name, None)
         return CourseWeekResult(
             name=course_week.name,
             toc=None,
@@ -77,41 +129,37 @@ class BaseAlgorithm(ABC):
     def _generate_week_item(
         self, course_week_item: CourseWeekItem
     ) -> CourseWeekItemResult:
+        self._aggregate_header(f"## {course_week_item.name}", None)
+        items = []
+        for course_file in course_week_item.items:
+            key_point = self._generate_course_file(course_file)
+            self._aggregate_key_point(self.aggregator.reserve(), key_point)
+            items.append(key_point)
         return CourseWeekItemResult(
             name=course_week_item.name,
             toc=None,
-            items=[
-                self._generate_course_file(course_file)
-                for course_file in course_week_item.items
-            ],
+            items=items,
+        )
+
+    def _aggregate_week_header(self, week_name: str, toc: str | None):
+        self.aggregator.add_part(week_name)
+        self._aggregate_header(f"# {week_name}", toc)
+
+    def _aggregate_header(self, title: str, toc: str | None):
+        self.aggregator.add_text(f"{title}\n\n---\n\n")
+        if toc is not None:
+            self.aggregator.add_text(toc)
+            self.aggregator.add_text("\n---\n\n")
+
+    def _aggregate_key_point(self, slot: int, key_point: KeyPoint):
+        # failed key points point to their source file, they are left out of the deck
+        self.aggregator.complete(
+            slot, key_point.path if key_point.type != "error" else None
         )
 
     def _aggregate_course(self):
         rich_print("Aggregating course slides...")
-        # check if dist_dir exists
-        if not os.path.exists(self.dist_dir):
-            os.makedirs(self.dist_dir, exist_ok=True)
-        # concat all slides
-        with open(self.final_file_path, "w") as final_file:
-            # add slide title
-            final_file.write(f"# {self.course_source.name}\n\n---\n\n")
-            # add week items
-            for week in self.course_result.weeks:
-                # add week_name and table of content
-                final_file.write(f"# {week.name}\n\n---\n\n")
-                final_file.write(week.toc)
-                final_file.write("\n---\n\n")
-
-                for week_item in week.items:
-                    # add week_item_name and table of content
-                    final_file.write(f"## {week_item.name}\n\n---\n\n")
-                    final_file.write(week_item.toc)
-                    final_file.write("\n---\n\n")
-
-                    for key_point in week_item.items:
-                        with open(key_point.path, "r") as key_point_file:
-                            final_file.write(key_point_file.read())
-                            final_file.write("\n\n")
+        self.aggregator.close()
 
     def _write_result_to_file(self, result: str, file_path: str):
         # parse folder and filename
@@ -123,3 +171,71 @@ class BaseAlgorithm(ABC):
         self.logger.debug(f"Writing to {file_path}")
         with open(file_path, "w") as f:
             f.write(result)
+
+    def _stream_result_to_file(self, chunks: Iterator[str], file_path: str, name: str):
+        """
+        write tokens to `file_path` as they arrive, a cut off stream leaves a partial file
+        """
+        with self._open_stream(file_path, name) as write:
+            for chunk in chunks:
+                write(chunk)
+
+    async def _astream_result_to_file(
+        self, chunks: AsyncIterator[str], file_path: str, name: str
+    ):
+        with self._open_stream(file_path, name) as write:
+            async for chunk in chunks:
+                write(chunk)
+
+    @contextmanager
+    def _open_stream(
+        self, file_path: str, name: str
+    ) -> Iterator[Callable[[str], None]]:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        self.logger.debug(f"Streaming to {file_path}")
+        task = self.progress.add_task(name, total=None) if self.progress else None
+        start = time.perf_counter()
+        time_to_first_token = None
+        chars = 0
+
+        with open(file_path, "w") as f:
+
+            def write(chunk: str):
+                nonlocal time_to_first_token, chars
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                f.write(chunk)
+                f.flush()
+                chars += len(chunk)
+                if task is not None:
+                    self.progress.update(task, description=f"{name} ({chars} chars)")
+
+            try:
+                yield write
+            finally:
+                if task is not None:
+                    self.progress.remove_task(task)
+
+        metric = StreamMetric(
+            name=name,
+            time_to_first_token=time_to_first_token or 0.0,
+            elapsed=time.perf_counter() - start,
+            chars=chars,
+        )
+        self.stream_metrics.append(metric)
+        rich_print(
+            f"Streamed {name}: first token after {metric.time_to_first_token:.2f}s, "
+            f"{metric.chars} chars in {metric.elapsed:.2f}s"
+        )
+
+    def _print_stream_metrics(self):
+        if not self.stream_metrics:
+            return
+        first_tokens = sorted(
+            metric.time_to_first_token for metric in self.stream_metrics
+        )
+        rich_print(
+            f"Streamed {len(first_tokens)} slides, time to first token: "
+            f"median {first_tokens[len(first_tokens) // 2]:.2f}s, "
+            f"max {first_tokens[-1]:.2f}s"
+        )
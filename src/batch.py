@@ -0,0 +1,128 @@
+"""
+run several courses in one process
+- clients, caches and the model call scheduler are shared by all courses
+- courses run in their own threads, their model calls are interleaved fairly by the scheduler
+"""
+
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from rich.table import Table
+
+from src.config import coursera_config, runtime_config
+from src.log import get_logger, rich_print
+from src.rag.scheduler import CourseCallStats, course_scope, get_scheduler
+from src.render import render_pdf
+from src.service import CourseAgent
+from src.tracing import bind_span, span
+
+
+@dataclass
+class CourseRun:
+    name: str
+    status: str = "pending"
+    elapsed: float = 0.0
+    error: str | None = None
+    final_file_path: str | None = None
+    pdf_path: str | None = None
+
+
+def resolve_courses(patterns: list[str]) -> list[str]:
+    """
+    expand course names and glob patterns, e.g. `python-*`, relative to the input folder
+    """
+    names = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(f"{coursera_config.INPUT_ROOT_FOLDER}/{pattern}"))
+        matches = [os.path.basename(path) for path in paths if os.path.isdir(path)]
+        if not matches:
+            rich_print(f"[yellow]No course matches [bold]{pattern}[/bold][/yellow]")
+        for name in matches:
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def _run_course(name: str, agents: list[CourseAgent]) -> CourseRun:
+    run = CourseRun(name=name)
+    start = time.perf_counter()
+    with course_scope(name), span("course", "batch", course=name):
+        try:
+            agent = CourseAgent(course_name=name)
+            # closed once every course is done, the clients are shared
+            agents.append(agent)
+            if runtime_config.BATCH_LOAD:
+                rich_print(f"Loading course: [bold]{name}")
+                agent.load_course()
+            rich_print(f"Generating course summary: [bold]{name}")
+            agent.summarize_course()
+            run.final_file_path = str(agent.final_file_path)
+            if runtime_config.BATCH_RENDER:
+                run.pdf_path = render_pdf(run.final_file_path, name)
+            run.status = "done"
+        except Exception as e:
+            get_logger().debug(traceback.format_exc())
+            run.status = "failed"
+            run.error = str(e)
+    run.elapsed = time.perf_counter() - start
+    rich_print(f"Finished [bold]{name}[/bold]: {run.status}")
+    return run
+
+
+def print_batch_summary(runs: list[CourseRun]):
+    stats = get_scheduler().stats
+    table = Table(title="Batch summary")
+    table.add_column("Course")
+    table.add_column("Status")
+    table.add_column("Time", justify="right")
+    table.add_column("Calls", justify="right")
+    table.add_column("Failed calls", justify="right")
+    table.add_column("Retries", justify="right")
+    table.add_column("Waited", justify="right")
+    table.add_column("Output")
+    for run in runs:
+        course_stats = stats.get(run.name, CourseCallStats())
+        color = "green" if run.status == "done" else "red"
+        table.add_row(
+            run.name,
+            f"[{color}]{run.status}[/{color}]",
+            f"{run.elapsed:.1f}s",
+            str(course_stats.calls),
+            str(course_stats.failures),
+            str(course_stats.retries),
+            f"{course_stats.waited:.1f}s",
+            run.error or run.pdf_path or run.final_file_path or "",
+        )
+    rich_print(table)
+
+
+def run_batch(patterns: list[str]) -> list[CourseRun]:
+    names = resolve_courses(patterns)
+    if not names:
+        rich_print("[red]No courses to run[/red]")
+        return []
+    if runtime_config.STREAM:
+        # a live progress view per course would fight over the terminal
+        rich_print("[yellow]--stream is not supported by batch, ignoring it[/yellow]")
+        runtime_config.STREAM = False
+
+    workers = min(max(1, runtime_config.BATCH_COURSES), len(names))
+    rich_print(
+        f"Running {len(names)} courses, {workers} at a time, "
+        f"at most {runtime_config.MAX_CONCURRENCY} model calls in flight"
+    )
+    agents: list[CourseAgent] = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            runs = list(
+                executor.map(bind_span(lambda name: _run_course(name, agents)), names)
+            )
+    finally:
+        for agent in agents:
+            agent.close()
+    print_batch_summary(runs)
+    return runs
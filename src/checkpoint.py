@@ -0,0 +1,90 @@
+"""
+checkpoint of a `generate` run, stored in its dist_dir so the run can be resumed
+- changes are written in batches, every `SAVE_EVERY` changes or `SAVE_INTERVAL`
+  seconds, `save` writes the rest at the end of the run
+"""
+
+import os
+import threading
+import time
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from src.schema import KeyPoint
+
+SAVE_EVERY = 20
+SAVE_INTERVAL = 10.0
+
+
+class Checkpoint(BaseModel):
+    # planning responses (TOCs), keyed by node
+    responses: dict[str, str] = Field(default_factory=dict)
+    # finished key points, keyed by node
+    key_points: dict[str, KeyPoint] = Field(default_factory=dict)
+
+    _path: str = PrivateAttr(default="")
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # changes since the last save
+    _pending: int = PrivateAttr(default=0)
+    _saved_at: float = PrivateAttr(default_factory=time.monotonic)
+
+    @staticmethod
+    def get_path(dist_dir: str) -> str:
+        return f"{dist_dir}/checkpoint.json"
+
+    @classmethod
+    def load(cls, dist_dir: str) -> "Checkpoint":
+        path = cls.get_path(dist_dir)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                checkpoint = cls.model_validate_json(f.read())
+        else:
+            checkpoint = cls()
+        checkpoint._path = path
+        return checkpoint
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # write to a temporary file first, so a crash never leaves a truncated checkpoint
+        with open(f"{self._path}.tmp", "w") as f:
+            f.write(self.model_dump_json())
+        os.replace(f"{self._path}.tmp", self._path)
+        self._pending = 0
+        self._saved_at = time.monotonic()
+
+    def _changed(self):
+        """
+        called with the lock held after every change
+        """
+        self._pending += 1
+        if (
+            self._pending >= SAVE_EVERY
+            or time.monotonic() - self._saved_at >= SAVE_INTERVAL
+        ):
+            self._save()
+
+    def get_response(self, key: str) -> str | None:
+        return self.responses.get(key)
+
+    def set_response(self, key: str, response: str):
+        with self._lock:
+            self.responses[key] = response
+            self._changed()
+
+    def get_key_point(self, key: str) -> KeyPoint | None:
+        """
+        :return: the finished key point, unless its slide file is gone
+        """
+        key_point = self.key_points.get(key)
+        if key_point is None or not os.path.exists(key_point.path):
+            return None
+        return key_point
+
+    def complete_key_point(self, key: str, key_point: KeyPoint):
+        with self._lock:
+            self.key_points[key] = key_point
+            self._changed()
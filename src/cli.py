@@ -4,11 +4,11 @@ from src.config import runtime_config
 from src.enums import AlgorithmEnum, EntityEnum, StorageEnum, VerbEnum
 
 
-def get_cli_args() -> tuple[VerbEnum, str]:
+def get_cli_args() -> tuple[VerbEnum, str | list[str]]:
     """
     Get the command line arguments and update the runtime_config
 
-    :return: the verb and the course_name
+    :return: the verb and the course_name, a list of course names for `batch`
     """
     # Create the parser
     parser = argparse.ArgumentParser(
@@ -44,6 +44,38 @@ def get_cli_args() -> tuple[VerbEnum, str]:
         help="skip to check whether the key point is a project or a concept, default is True",
         action=argparse.BooleanOptionalAction,
     )
+    parser.add_argument(
+        "--async-generate",
+        help="generate slides concurrently through the async chain API, default is False",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        help="maximum number of in-flight model requests of the process, default is 8",
+        action="store",
+        type=int,
+        default=8,
+    )
+    parser.add_argument(
+        "--stream",
+        help="stream slide tokens to disk as they arrive, streamed calls bypass the LLM response cache, default is False",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--trace",
+        help="record spans of the run and write them as a Chrome trace to this file",
+        action="store",
+        type=str,
+        metavar="TRACE_FILE",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="only load new or changed files and drop chunks of removed files, default is True",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+    )
     parser.add_argument(
         "--exclude-file-pattern",
         help="exclude file pattern",
@@ -138,6 +170,56 @@ def get_cli_args() -> tuple[VerbEnum, str]:
         action="store",
         type=str,
     )
+    generate_parser.add_argument(
+        "--resume",
+        help="resume an interrupted run from its dist_dir, finished TOCs and slides are skipped",
+        action="store",
+        type=str,
+        metavar="DIST_DIR",
+    )
+    generate_parser.add_argument(
+        "--invalidate-prompt",
+        help="drop cached LLM responses of a prompt file before generating, e.g. concept_slide_prompt",
+        action="append",
+        default=[],
+    )
+
+    # Add the batch verb
+    batch_parser = verbs.add_parser(
+        str(VerbEnum.BATCH),
+        help="load and generate several courses in one process",
+        description="""
+        - load and generate every matching course, several courses at a time
+        - model calls of all courses share --max-concurrency, interleaved fairly
+        - print a summary of time, calls and failures per course
+        """,
+    )
+    batch_parser.add_argument(
+        str(EntityEnum.COURSE_NAME),
+        help="course names or glob patterns, e.g. 'python-*'",
+        action="store",
+        type=str,
+        nargs="+",
+    )
+    batch_parser.add_argument(
+        "--max-courses",
+        help="maximum number of courses processed at a time, default is 4",
+        action="store",
+        type=int,
+        default=4,
+    )
+    batch_parser.add_argument(
+        "--load",
+        help="load each course before generating, default is True",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+    )
+    batch_parser.add_argument(
+        "--render",
+        help="render each course summary to PDF, default is True",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+    )
 
     # Parse the arguments
     args = parser.parse_args()
@@ -150,7 +232,18 @@ def _update_runtime_config(args):
     runtime_config.QUIET = args.quiet
     runtime_config.INTERACTIVE = args.interactive
     runtime_config.ALGORITHM = args.algorithm
+    runtime_config.STORAGE = StorageEnum(args.storage)
     runtime_config.SKIP_PROJECT = args.skip_project
     runtime_config.EXCLUDE_PATTERN = args.exclude_file_pattern
+    runtime_config.ASYNC_GENERATE = args.async_generate
+    runtime_config.MAX_CONCURRENCY = max(1, args.max_concurrency)
+    runtime_config.INCREMENTAL = args.incremental
+    runtime_config.STREAM = args.stream
+    runtime_config.TRACE_FILE = args.trace
+    runtime_config.INVALIDATE_PROMPTS = getattr(args, "invalidate_prompt", [])
+    runtime_config.RESUME_DIR = getattr(args, "resume", None)
+    runtime_config.BATCH_COURSES = getattr(args, "max_courses", 4)
+    runtime_config.BATCH_LOAD = getattr(args, "load", True)
+    runtime_config.BATCH_RENDER = getattr(args, "render", True)
 
     return args
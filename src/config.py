@@ -1,10 +1,11 @@
+import os
 from typing import Optional
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
-from src.enums import AlgorithmEnum
+from src.enums import AlgorithmEnum, StorageEnum
 
 load_dotenv()
 
@@ -14,6 +15,8 @@ class CourseraConfig(BaseSettings):
     EXCLUDE_WEEKS: list = Field(default=[])
     RESULT_ROOT_FOLDER: str = Field(default=".")
     PROMPTS_FOLDER: str = Field(default="./prompts")
+    COURSE_INDEX: bool = Field(default=True)
+    INDEX_WORKERS: int = Field(default=8)
 
     model_config = SettingsConfigDict(
         env_prefix="COURSERA_",
@@ -41,6 +44,8 @@ langchain_config = LangChainConfig()
 class ChromaConfig(BaseSettings):
     HOST: str = Field(default="127.0.0.1")
     PORT: int = Field(default=8888)
+    KEEPALIVE_SECS: float = Field(default=40.0)
+    MAX_CONNECTIONS: int = Field(default=32)
 
     model_config = SettingsConfigDict(
         env_prefix="CHROMA_",
@@ -50,13 +55,191 @@ class ChromaConfig(BaseSettings):
 chroma_config = ChromaConfig()
 
 
+class NumpyStoreConfig(BaseSettings):
+    FOLDER: str = Field(default="./stateful_volumes/numpy")
+
+    model_config = SettingsConfigDict(
+        env_prefix="NUMPY_STORE_",
+    )
+
+
+numpy_store_config = NumpyStoreConfig()
+
+
+class IngestConfig(BaseSettings):
+    PARSE_WORKERS: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    EMBEDDING_BATCH_SIZE: int = Field(default=512)
+    EMBED_CONCURRENCY: int = Field(default=4)
+    WRITE_CONCURRENCY: int = Field(default=4)
+    QUEUE_SIZE: int = Field(default=8)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_INGEST_",
+    )
+
+
+ingest_config = IngestConfig()
+
+
+class CacheConfig(BaseSettings):
+    FOLDER: str = Field(default="./.cache")
+    EMBEDDING_CACHE: bool = Field(default=True)
+    EMBEDDING_MAX_BYTES: int = Field(default=1024 * 1024 * 1024)
+    LLM_CACHE: bool = Field(default=True)
+    RETRIEVAL_CACHE_SIZE: int = Field(default=4096)
+    RETRIEVAL_CACHE_PERSIST: bool = Field(default=True)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_CACHE_",
+    )
+
+
+cache_config = CacheConfig()
+
+
+class SchedulerConfig(BaseSettings):
+    REQUESTS_PER_MINUTE: Optional[int] = Field(default=None)
+    TOKENS_PER_MINUTE: Optional[int] = Field(default=None)
+    COMPLETION_TOKENS: int = Field(default=512)
+    MAX_RETRIES: int = Field(default=6)
+    BACKOFF_BASE: float = Field(default=1.0)
+    BACKOFF_MAX: float = Field(default=60.0)
+    MIN_CONCURRENCY: int = Field(default=1)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_SCHEDULER_",
+    )
+
+
+scheduler_config = SchedulerConfig()
+
+
+class ContextConfig(BaseSettings):
+    PACKING: bool = Field(default=True)
+    TOKEN_BUDGET: int = Field(default=1500)
+    RETRIEVER_K: int = Field(default=8)
+    DUPLICATE_THRESHOLD: float = Field(default=0.8)
+    SHINGLE_SIZE: int = Field(default=5)
+    ENCODING: str = Field(default="cl100k_base")
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_CONTEXT_",
+    )
+
+
+context_config = ContextConfig()
+
+
+class RenderConfig(BaseSettings):
+    MARP_COMMAND: str = Field(default="marp")
+    WORKERS: int = Field(default_factory=lambda: os.cpu_count() or 1)
+    SPLIT: bool = Field(default=True)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_RENDER_",
+    )
+
+
+render_config = RenderConfig()
+
+
+class SrtConfig(BaseSettings):
+    NATIVE: bool = Field(default=True)
+    PARAGRAPH_GAP: float = Field(default=2.0)
+    # captions without punctuation end a sentence at a cue boundary after this
+    MAX_SENTENCE_CHARS: int = Field(default=400)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_SRT_",
+    )
+
+
+srt_config = SrtConfig()
+
+
+class HtmlConfig(BaseSettings):
+    NATIVE: bool = Field(default=True)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_HTML_",
+    )
+
+
+html_config = HtmlConfig()
+
+
+class ChunkingConfig(BaseSettings):
+    MAX_TOKENS: int = Field(default=400)
+    MIN_TOKENS: int = Field(default=150)
+    OVERLAP_TOKENS: int = Field(default=40)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_CHUNKING_",
+    )
+
+
+chunking_config = ChunkingConfig()
+
+
+class DedupConfig(BaseSettings):
+    ENABLED: bool = Field(default=True)
+    # estimated Jaccard similarity of the word shingles of two chunks
+    THRESHOLD: float = Field(default=0.8)
+    SHINGLE_SIZE: int = Field(default=5)
+    NUM_PERM: int = Field(default=128)
+    BANDS: int = Field(default=32)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_DEDUP_",
+    )
+
+
+dedup_config = DedupConfig()
+
+
+class SequentialConfig(BaseSettings):
+    CHUNK_TOKENS: int = Field(default=3000)
+    FILE_WORKERS: int = Field(default=4)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_SEQUENTIAL_",
+    )
+
+
+sequential_config = SequentialConfig()
+
+
+class TraceConfig(BaseSettings):
+    OTLP_ENDPOINT: Optional[str] = Field(default=None)
+    SERVICE_NAME: str = Field(default="coursera-agent")
+    OTLP_TIMEOUT: int = Field(default=10)
+
+    model_config = SettingsConfigDict(
+        env_prefix="COURSERA_TRACE_",
+    )
+
+
+trace_config = TraceConfig()
+
+
 class RuntimeConfig(BaseSettings):
     VERBOSE: bool = Field(default=False)
     QUIET: bool = Field(default=False)
     INTERACTIVE: bool = Field(default=False)
     ALGORITHM: AlgorithmEnum = Field(default=AlgorithmEnum.RAG)
+    STORAGE: StorageEnum = Field(default=StorageEnum.CHROMA)
     SKIP_PROJECT: bool = Field(default=True)
     EXCLUDE_PATTERN: Optional[str] = Field(default=None)
+    ASYNC_GENERATE: bool = Field(default=False)
+    MAX_CONCURRENCY: int = Field(default=8)
+    INCREMENTAL: bool = Field(default=True)
+    INVALIDATE_PROMPTS: list[str] = Field(default=[])
+    RESUME_DIR: Optional[str] = Field(default=None)
+    STREAM: bool = Field(default=False)
+    BATCH_COURSES: int = Field(default=4)
+    BATCH_LOAD: bool = Field(default=True)
+    BATCH_RENDER: bool = Field(default=True)
+    TRACE_FILE: Optional[str] = Field(default=None)
 
 
 runtime_config = RuntimeConfig()
@@ -12,6 +12,7 @@ class VerbEnum(_BaseEnum):
     LOAD = "load"
     DELETE = "delete"
     GENERATE = "generate"
+    BATCH = "batch"
 
 
 class EntityEnum(_BaseEnum):
@@ -25,3 +26,4 @@ class AlgorithmEnum(_BaseEnum):
 
 class StorageEnum(_BaseEnum):
     CHROMA = "chroma"
+    NUMPY = "numpy"
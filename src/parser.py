@@ -2,8 +2,11 @@
 get file path and load to schema
 """
 
+import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from src.schema import (
     Course,
@@ -17,24 +20,30 @@ from src.log import get_logger
 logger = get_logger()
 
 
-def _get_course_files(path: str) -> list[CourseFile]:
+@lru_cache
+def _compile_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def _get_course_files(path: str, dir_mtimes: dict[str, int]) -> list[CourseFile]:
     """
     get all files in path
     """
+    dir_mtimes[path] = os.stat(path).st_mtime_ns
+    exclude_pattern = None
+    if runtime_config.EXCLUDE_PATTERN is not None:
+        exclude_pattern = _compile_pattern(runtime_config.EXCLUDE_PATTERN)
     course_files = []
     for f in os.scandir(path):
         if f.is_dir():
-            course_files.extend(_get_course_files(f.path))
+            course_files.extend(_get_course_files(f.path, dir_mtimes))
         else:
             if not (f.name.endswith(".html") or f.name.endswith(".srt")):
                 logger.debug(f"Skipping file: {f.name}")
                 continue
             # check exclude pattern
             logger.debug(f"Checking file: {f.name}")
-            if (
-                runtime_config.EXCLUDE_PATTERN is not None
-                and re.search(runtime_config.EXCLUDE_PATTERN, f.name) is not None
-            ):
+            if exclude_pattern is not None and exclude_pattern.search(f.name):
                 logger.debug(f"Skipping file: {f.name}")
                 continue
             course_files.append(CourseFile(name=f.name, path=f.path))
@@ -42,34 +51,106 @@ def _get_course_files(path: str) -> list[CourseFile]:
     return course_files
 
 
-def _get_course_week_items(path: str) -> list[CourseWeekItem]:
+def _get_course_week_items(
+    path: str, dir_mtimes: dict[str, int]
+) -> list[CourseWeekItem]:
     """
     get all week items in path
     """
+    dir_mtimes[path] = os.stat(path).st_mtime_ns
     return [
         CourseWeekItem(
             name=f.name,
             path=f.path,
-            items=_get_course_files(f.path),
+            items=_get_course_files(f.path, dir_mtimes),
         )
         for f in os.scandir(path)
         if f.is_dir()
     ]
 
 
-def _get_course_weeks(path: str) -> list[CourseWeek]:
+def _get_course_week(path: str, name: str) -> tuple[CourseWeek, dict[str, int]]:
+    dir_mtimes = {}
+    week = CourseWeek(
+        name=name, path=path, items=_get_course_week_items(path, dir_mtimes)
+    )
+    return week, dir_mtimes
+
+
+def _get_course_weeks(path: str, dir_mtimes: dict[str, int]) -> list[CourseWeek]:
     """
-    get all weeks in path
+    get all weeks in path, each week is walked in its own thread
     """
+    dir_mtimes[path] = os.stat(path).st_mtime_ns
     # check if week is exclude
     exclude_list = coursera_config.EXCLUDE_WEEKS
     valid_weeks = [
         f for f in os.scandir(path) if f.is_dir() and f.name not in exclude_list
     ]
-    return [
-        CourseWeek(name=f.name, path=f.path, items=_get_course_week_items(f.path))
-        for f in valid_weeks
-    ]
+    with ThreadPoolExecutor(max_workers=coursera_config.INDEX_WORKERS) as executor:
+        results = list(
+            executor.map(lambda f: _get_course_week(f.path, f.name), valid_weeks)
+        )
+    weeks = []
+    for week, week_dir_mtimes in results:
+        weeks.append(week)
+        dir_mtimes.update(week_dir_mtimes)
+    return weeks
+
+
+def _get_index_path(path: str) -> str:
+    """
+    the course index is stored next to the course directory
+    """
+    parent, name = os.path.split(os.path.normpath(path))
+    return os.path.join(parent, f".{name}.index.json")
+
+
+def _get_index_options() -> dict:
+    return {
+        "exclude_pattern": runtime_config.EXCLUDE_PATTERN,
+        "exclude_weeks": list(coursera_config.EXCLUDE_WEEKS),
+    }
+
+
+def _load_course_index(path: str) -> Course | None:
+    """
+    :return: the indexed course, unless any indexed directory changed since
+    """
+    index_path = _get_index_path(path)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("options") != _get_index_options():
+        return None
+    # adding, removing or renaming an entry changes the mtime of its directory
+    for dir_path, mtime in index["dir_mtimes"].items():
+        try:
+            if os.stat(dir_path).st_mtime_ns != mtime:
+                return None
+        except OSError:
+            return None
+    return Course.model_validate(index["course"])
+
+
+def _save_course_index(path: str, course: Course, dir_mtimes: dict[str, int]):
+    index_path = _get_index_path(path)
+    index = {
+        "options": _get_index_options(),
+        "dir_mtimes": dir_mtimes,
+        "course": course.model_dump(),
+    }
+    try:
+        with open(f"{index_path}.tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(f"{index_path}.tmp", index_path)
+    except OSError as e:
+        # e.g. a read-only input volume, the course is simply walked again next time
+        logger.debug(f"Cannot write course index {index_path}: {e}")
 
 
 def get_course(path: str) -> Course:
@@ -80,4 +161,18 @@ def get_course(path: str) -> Course:
     if not os.path.exists(path):
         raise FileNotFoundError(f"Course path not found: {path}")
 
-    return Course(name=os.path.basename(path), path=path, weeks=_get_course_weeks(path))
+    if coursera_config.COURSE_INDEX:
+        course = _load_course_index(path)
+        if course is not None:
+            logger.debug(f"Using course index of {path}")
+            return course
+
+    dir_mtimes = {}
+    course = Course(
+        name=os.path.basename(path),
+        path=path,
+        weeks=_get_course_weeks(path, dir_mtimes),
+    )
+    if coursera_config.COURSE_INDEX:
+        _save_course_index(path, course, dir_mtimes)
+    return course
@@ -1,5 +1,4 @@
 import asyncio
-import os
 from typing import TYPE_CHECKING
 
 from src.algorithm import BaseAlgorithm
@@ -7,7 +6,7 @@ from src.log import rich_print
 from src.utils import parse_markdown_list
 
 
-from src.config import runtime_config
+from src.config import dedup_config, runtime_config
 from src.schema import (
     Course,
     CourseResult,
@@ -16,19 +15,23 @@ from src.schema import (
     KeyPoint,
 )
 
-from src.rag.core import save_file, get_retriever, get_llm
+from src.rag.core import get_retriever, get_llm
+from src.rag.cache import prompt_scope
 from src.rag.chain import (
     get_rag_chain,
 )
-from src.rag.prompts import (
-    course_toc_template,
-    week_toc_template,
-    week_item_toc_template,
-    is_concept_or_project_template,
-    concept_slide_template,
-    project_slide_template,
+from src.rag.prompts import get_prompt_template
+from src.rag.vector_database import (
+    close_chroma_client,
+    delete_collection,
+    delete_embeddings,
 )
-from src.rag.vector_database import delete_collection
+from src.rag.manifest import CollectionManifest
+from src.rag.embedding import get_openai_embedding
+from src.rag.pipeline import ingest_files
+from src.rag.dedup import DedupIndex, get_dedup_fingerprint
+from src.rag.loader import get_loader_fingerprint
+from src.tracing import count, span
 
 if TYPE_CHECKING:
     from langchain_openai import ChatOpenAI
@@ -36,14 +39,53 @@ if TYPE_CHECKING:
     from langchain_core.runnables import RunnablePassthrough
 
 
+def _normalize_key_point_type(answer: str) -> str:
+    """
+    map a free-form answer, e.g. `Project.` or `**concept**`, to `concept` or `project`
+    """
+    return "project" if "project" in answer.lower() else "concept"
+
+
+def _format_batch_classification_query(key_points: list[str]) -> str:
+    return get_prompt_template("batch_is_concept_or_project_prompt").format(
+        key_points="\n".join(f"  - {key_point}" for key_point in key_points)
+    )
+
+
+def _parse_key_point_types(answer: str, key_points: list[str]) -> dict[str, str]:
+    """
+    input example:
+    ```
+    - Variables: concept
+    - Guess the number game: project
+    ```
+    answers are matched by name, or by position when the names were rewritten
+    """
+    labels = []
+    for item in parse_markdown_list(answer):
+        name, separator, label = item.rpartition(":")
+        if not separator:
+            continue
+        labels.append((name.strip(" `*").lower(), _normalize_key_point_type(label)))
+    by_name = dict(labels)
+    key_point_types = {}
+    for index, key_point in enumerate(key_points):
+        label = by_name.get(key_point.strip(" `*").lower())
+        if label is None and len(labels) == len(key_points):
+            label = labels[index][1]
+        if label is not None:
+            key_point_types[key_point] = label
+    return key_point_types
+
+
 class RAGAlgorithm(BaseAlgorithm):
     # set up configuration
     course_name: str | None = None
     collection_name: str | None = None
     # set up RAG chain
-    retriever: "VectorStoreRetriever" | None = None
-    llm: "ChatOpenAI" | None = None
-    rag_chain: "RunnablePassthrough" | None = None
+    retriever: "VectorStoreRetriever | None" = None
+    llm: "ChatOpenAI | None" = None
+    rag_chain: "RunnablePassthrough | None" = None
 
     def __init__(
         self,
@@ -65,45 +107,148 @@ class RAGAlgorithm(BaseAlgorithm):
         self.previous_week_toc = []
         self.previous_week_item_toc = []
         self.previous_key_point = []
+        # not checkpointed, a resumed run rebuilds them in the same order from the
+        # checkpointed planning responses
+        # async generation state
+        self._semaphore: asyncio.Semaphore | None = None
+        self._pending_week_items: list[
+            tuple[CourseWeekItemResult, list[asyncio.Task]]
+        ] = []
 
     # private methods for `summarize_course`
     def _init_rag_chain(self):
         self.retriever = get_retriever(self.collection_name)
         self.llm = get_llm()
-        self.rag_chain = get_rag_chain(self.retriever, self.llm)
+        self.rag_chain = get_rag_chain(self.retriever, self.llm, self.collection_name)
         if runtime_config.VERBOSE:
             self.logger.debug("RAG chain initialized")
             self.logger.debug(self.rag_chain)
             self.logger.debug(self.retriever)
             self.logger.debug(self.llm)
 
+    def close(self) -> None:
+        close_chroma_client()
+
     def load_course(self) -> None:
-        self._init_rag_chain()
+        asyncio.run(self._store_course_concurrently(self.course_source))
 
     async def _store_course_concurrently(self, course: Course):
         # private methods for `store_course`
-        async def store_course(file_path: str):
-            self.logger.debug(f"Storing {file_path}")
-            save_file(self.collection_name, file_path)
+        # every chunk knows where its file sits in the course
+        metadata = {
+            item.path: {
+                "week": week.name,
+                "week_item": week_item.name,
+                "file": item.name,
+            }
+            for week in course.weeks
+            for week_item in week.items
+            for item in week_item.items
+        }
+        paths = list(metadata)
+
+        manifest = CollectionManifest.load(self.collection_name)
+        # deduplication decides which chunks are stored, like the chunking settings
+        loader = f"{get_loader_fingerprint()}|{get_dedup_fingerprint()}"
+        if manifest.files and manifest.loader != loader:
+            rich_print("Chunking settings changed, reloading every file")
+        incremental = runtime_config.INCREMENTAL and manifest.loader == loader
+        if incremental:
+            changed_paths, removed_paths = manifest.diff(paths, metadata)
+        else:
+            current = set(paths)
+            changed_paths = paths
+            removed_paths = [path for path in manifest.files if path not in current]
+
+        dedup = None
+        if dedup_config.ENABLED:
+            dedup = (
+                DedupIndex.load(self.collection_name)
+                if incremental
+                else DedupIndex(self.collection_name)
+            )
+            reloaded = set(changed_paths) | set(removed_paths)
+            stored_ids = {
+                chunk_id
+                for path, entry in manifest.files.items()
+                if path not in reloaded
+                for chunk_id in entry.chunk_ids
+            }
+            # files which skipped chunks of a changed or removed file store them now
+            orphans = dedup.prune(stored_ids, reloaded)
+            changed_paths = changed_paths + [
+                path for path in orphans if path in metadata
+            ]
+        rich_print(
+            f"Storing [bold]{course.name}[/bold] to vector database: "
+            f"{len(changed_paths)} new or changed, {len(removed_paths)} removed, "
+            f"{len(paths) - len(changed_paths)} unchanged files"
+        )
 
-        tasks = []
-        for week in course.weeks:
-            for week_item in week.items:
-                for item in week_item.items:
-                    tasks.append(store_course(item.path))
+        stats = await ingest_files(
+            self.collection_name,
+            changed_paths,
+            get_openai_embedding(),
+            root=course.path,
+            metadata=metadata,
+            dedup=dedup,
+        )
 
-        rich_print(f"Storing [bold]{course.name}[/bold] to vector database")
+        # drop chunks of removed files and stale chunks of changed files
+        stale_ids = []
+        for path in removed_paths:
+            stale_ids.extend(manifest.remove(path))
+        for path, chunk_ids in stats.stored_files().items():
+            stale_ids.extend(manifest.update(path, chunk_ids, metadata.get(path)))
+        delete_embeddings(self.collection_name, stale_ids)
+        if dedup is not None and stats.failed_files:
+            # chunks of failed files became canonical while parsing but were not stored,
+            # the files which skipped their duplicates store them on the next load
+            stored_ids = {
+                chunk_id
+                for entry in manifest.files.values()
+                for chunk_id in entry.chunk_ids
+            }
+            for path in dedup.prune(stored_ids, set(stats.failed_files)):
+                manifest.invalidate(path)
+        if stats.chunks or stale_ids:
+            # invalidates retrieval contexts cached for the previous content
+            manifest.bump_version()
+        if not stats.failed_files and not stats.failed_chunks:
+            manifest.loader = loader
+        manifest.save()
+        if dedup is not None:
+            dedup.save()
 
-        await asyncio.gather(*tasks)
+        rich_print(
+            f"Stored [bold]{stats.chunks}[/bold] chunks from [bold]{stats.files}[/bold] files "
+            f"in {stats.batches} batches, deleted {len(stale_ids)} stale chunks"
+        )
+        if stats.duplicate_chunks:
+            rich_print(
+                f"Skipped [bold]{stats.duplicate_chunks}[/bold] near-duplicate chunks"
+            )
+        if stats.failed_files or stats.failed_chunks:
+            rich_print(
+                f"[red]Failed to load {len(stats.failed_files)} files "
+                f"and {stats.failed_chunks} chunks, they will be retried on the next load[/red]"
+            )
 
     def delete_course(self) -> None:
-        delete_collection(self.collection_name)
-        rich_print(f"Deleted [bold]{self.collection_name}[/bold] collection")
+        if delete_collection(self.collection_name):
+            CollectionManifest.delete(self.collection_name)
+            DedupIndex.delete(self.collection_name)
+            rich_print(f"Deleted [bold]{self.collection_name}[/bold] collection")
 
     def _generate_course(self) -> CourseResult:
         self._init_rag_chain()
+        if runtime_config.ASYNC_GENERATE:
+            asyncio.run(self._agenerate_course())
+            return
         # get course table of content
-        self.course_toc_resp: str = self.rag_chain.invoke(course_toc_template)
+        self.course_toc_resp: str = self._plan(
+            "course_toc", get_prompt_template("course_toc_prompt"), "course_toc_prompt"
+        )
         if runtime_config.VERBOSE:
             self.logger.debug("Course Table of Content")
             self.logger.debug(self.course_toc_resp)
@@ -124,13 +269,16 @@ class RAGAlgorithm(BaseAlgorithm):
     def _generate_week(self, week_name: str) -> CourseWeekResult:
         # prevent duplicate entries
         self.previous_week_toc.append(week_name)
+        self._aggregate_week_header(week_name, week_name)
         self.logger.debug("previous_week_toc")
         self.logger.debug(self.previous_week_toc)
 
-        week_toc_response = self.rag_chain.invoke(
-            week_toc_template.format(
+        week_toc_response = self._plan(
+            f"week_toc/{week_name}",
+            get_prompt_template("week_toc_prompt").format(
                 week_name=week_name, previous_weeks_toc=str(self.previous_week_item_toc)
-            )
+            ),
+            "week_toc_prompt",
         )
         cur_week_toc = parse_markdown_list(week_toc_response)
         self.logger.debug(cur_week_toc)
@@ -152,15 +300,18 @@ class RAGAlgorithm(BaseAlgorithm):
     def _generate_week_item(self, week_item_name: str) -> CourseWeekItemResult:
         # prevent duplicate entries
         self.previous_week_item_toc.append(week_item_name)
+        self._aggregate_header(f"## {week_item_name}", week_item_name)
         self.logger.debug("previous_week_item_toc")
         self.logger.debug(self.previous_week_item_toc)
 
-        week_item_toc = self.rag_chain.invoke(
-            week_item_toc_template.format(
+        week_item_toc = self._plan(
+            f"week_item_toc/{self.previous_week_toc[-1]}/{week_item_name}",
+            get_prompt_template("week_item_toc_prompt").format(
                 week_name=self.previous_week_toc[-1],
                 week_item_name=week_item_name,
                 previous_week_items_toc=str(self.previous_key_point),
-            )
+            ),
+            "week_item_toc_prompt",
         )
         cur_week_item_toc = parse_markdown_list(week_item_toc)
         self.logger.debug(cur_week_item_toc)
@@ -170,24 +321,52 @@ class RAGAlgorithm(BaseAlgorithm):
         )
         rich_print(cur_week_item_toc)
 
+        key_point_types = {}
+        if not runtime_config.SKIP_PROJECT:
+            key_point_types = self._classify_key_points(
+                f"classify/{self.previous_week_toc[-1]}/{week_item_name}",
+                cur_week_item_toc,
+            )
+
+        items = []
+        for key_point in cur_week_item_toc:
+            slot = self.aggregator.reserve()
+            key_point_result = self._generate_course_file(
+                key_point, key_point_types.get(key_point)
+            )
+            self._aggregate_key_point(slot, key_point_result)
+            items.append(key_point_result)
+
         return CourseWeekItemResult(
             name=week_item_name,
             toc=week_item_name,
-            items=[
-                self._generate_course_file(key_point) for key_point in cur_week_item_toc
-            ],
+            items=items,
         )
 
-    def _generate_course_file(self, key_point: str) -> KeyPoint:
+    def _generate_course_file(
+        self, key_point: str, key_point_type: str | None = None
+    ) -> KeyPoint:
+        with span("key_point", "slide", key_point=key_point):
+            return self._generate_key_point(key_point, key_point_type)
+
+    def _generate_key_point(
+        self, key_point: str, key_point_type: str | None = None
+    ) -> KeyPoint:
         # prevent duplicate entries
         self.previous_key_point.append(key_point)
-        key_point_type = "concept"
-
-        if not runtime_config.SKIP_PROJECT:
-            # runtime_config.SKIP_PROJECT
-            # ignore checking if key point is a concept or project
-            # generate only concept slides
-            key_point_type = self._is_concept_or_project(key_point)
+        checkpoint_key = f"key_point/{key_point}"
+        finished_key_point = self.checkpoint.get_key_point(checkpoint_key)
+        if finished_key_point is not None:
+            rich_print(f"Skipping finished slides for {key_point}")
+            return finished_key_point
+
+        if key_point_type is None:
+            key_point_type = "concept"
+            if not runtime_config.SKIP_PROJECT:
+                # runtime_config.SKIP_PROJECT
+                # ignore checking if key point is a concept or project
+                # generate only concept slides
+                key_point_type = self._is_concept_or_project(key_point)
 
         final_path = f"{self.dist_dir}/{key_point}.md"
         self.logger.debug(f"final_path: {final_path}")
@@ -199,55 +378,287 @@ class RAGAlgorithm(BaseAlgorithm):
         else:
             self._generate_project_slide(key_point, final_path)
 
-        return KeyPoint(name=key_point, path=final_path, type=key_point_type)
+        key_point_result = KeyPoint(
+            name=key_point, path=final_path, type=key_point_type
+        )
+        self.checkpoint.complete_key_point(checkpoint_key, key_point_result)
+        return key_point_result
 
     def _is_concept_or_project(self, key_point: str) -> str:
         """
         determine if a key point is a `concept` or a `project`
         """
-        is_concept_or_project = self.rag_chain.invoke(
-            is_concept_or_project_template.format(key_point=key_point)
+        is_concept_or_project = self._invoke(
+            get_prompt_template("is_concept_or_project_prompt").format(
+                key_point=key_point
+            ),
+            "is_concept_or_project_prompt",
         )
         self.logger.debug(f"{key_point} is {is_concept_or_project}")
-        return is_concept_or_project
+        return _normalize_key_point_type(is_concept_or_project)
+
+    def _pending_key_points(self, key_points: list[str]) -> list[str]:
+        return [
+            key_point
+            for key_point in key_points
+            if self.checkpoint.get_key_point(f"key_point/{key_point}") is None
+        ]
+
+    def _classify_key_points(
+        self, checkpoint_key: str, key_points: list[str]
+    ) -> dict[str, str]:
+        """
+        classify all unfinished key points of a week item in one request
+        :return: `concept` or `project` per key point, key points missing in the
+        answer are classified one by one later
+        """
+        pending = self._pending_key_points(key_points)
+        if not pending:
+            return {}
+        answer = self._plan(
+            checkpoint_key,
+            _format_batch_classification_query(pending),
+            "batch_is_concept_or_project_prompt",
+        )
+        return _parse_key_point_types(answer, pending)
 
     def _generate_concept_slide(self, key_point: str, final_path: str) -> str:
-        concept_slide = self.rag_chain.invoke(
-            concept_slide_template.format(key_point=key_point)
-        )
-        self.logger.debug(f"{key_point} slide:\n{concept_slide}")
-        self._write_resp_to_file(concept_slide, final_path)
+        self._generate_slide(key_point, final_path, "concept_slide_prompt")
 
     def _generate_project_slide(self, key_point: str, final_path: str) -> str:
-        project_slide = self.rag_chain.invoke(
-            project_slide_template.format(key_point=key_point)
-        )
-        self.logger.debug(f"{key_point} slide:\n{project_slide}")
-        self._write_resp_to_file(project_slide, final_path)
-
-    def _aggregate_course(self):
-        rich_print("Aggregating course slides...")
-        # check if dist_dir exists
-        if not os.path.exists(self.dist_dir):
-            os.makedirs(self.dist_dir, exist_ok=True)
-        # concat all slides
-        with open(self.final_file_path, "w") as final_file:
-            # add slide title
-            final_file.write(f"# {self.course_name}\n\n---\n\n")
-            # add week items
-            for week in self.course_result.weeks:
-                # add week_name and table of content
-                final_file.write(f"# {week.name}\n\n---\n\n")
-                final_file.write(week.toc)
-                final_file.write("\n---\n\n")
-
-                for week_item in week.items:
-                    # add week_item_name and table of content
-                    final_file.write(f"## {week_item.name}\n\n---\n\n")
-                    final_file.write(week_item.toc)
-                    final_file.write("\n---\n\n")
-
-                    for key_point in week_item.items:
-                        with open(key_point.path, "r") as key_point_file:
-                            final_file.write(key_point_file.read())
-                            final_file.write("\n\n")
+        self._generate_slide(key_point, final_path, "project_slide_prompt")
+
+    def _generate_slide(self, key_point: str, final_path: str, prompt_name: str):
+        query = get_prompt_template(prompt_name).format(key_point=key_point)
+        if runtime_config.STREAM:
+            self._stream_result_to_file(
+                self.rag_chain.stream(query), final_path, key_point
+            )
+            return
+        slide = self._invoke(query, prompt_name)
+        self.logger.debug(f"{key_point} slide:\n{slide}")
+        self._write_result_to_file(slide, final_path)
+
+    def _invoke(self, query: str, prompt_name: str) -> str:
+        """
+        invoke the RAG chain, cached responses are tagged with `prompt_name`
+        """
+        with prompt_scope(prompt_name), span(prompt_name, "chain"):
+            return self.rag_chain.invoke(query)
+
+    def _plan(self, checkpoint_key: str, query: str, prompt_name: str) -> str:
+        """
+        invoke a planning (TOC) query, answered from the checkpoint when resuming
+        """
+        response = self.checkpoint.get_response(checkpoint_key)
+        if response is None:
+            response = self._invoke(query, prompt_name)
+            self.checkpoint.set_response(checkpoint_key, response)
+        else:
+            count("checkpoint_hits")
+        return response
+
+    # private methods for async `summarize_course`
+    async def _ainvoke(self, query: str, prompt_name: str) -> str:
+        """
+        invoke the RAG chain, bounded by `runtime_config.MAX_CONCURRENCY` in-flight requests
+        """
+        async with self._semaphore:
+            with prompt_scope(prompt_name), span(prompt_name, "chain"):
+                return await self.rag_chain.ainvoke(query)
+
+    async def _aplan(self, checkpoint_key: str, query: str, prompt_name: str) -> str:
+        response = self.checkpoint.get_response(checkpoint_key)
+        if response is None:
+            response = await self._ainvoke(query, prompt_name)
+            self.checkpoint.set_response(checkpoint_key, response)
+        else:
+            count("checkpoint_hits")
+        return response
+
+    async def _agenerate_course(self):
+        """
+        TOCs are planned one after another because each one depends on the
+        `previous_*` lists, while key point slides are scheduled as tasks as soon
+        as their week item is planned and awaited at the end.
+        """
+        self._semaphore = asyncio.Semaphore(runtime_config.MAX_CONCURRENCY)
+        self._pending_week_items = []
+
+        self.course_toc_resp = await self._aplan(
+            "course_toc", get_prompt_template("course_toc_prompt"), "course_toc_prompt"
+        )
+        self.course_toc = parse_markdown_list(self.course_toc_resp)
+        self.logger.debug("Course Table of Content")
+        self.logger.debug(self.course_toc_resp)
+
+        rich_print("[bold]Generating course TOC[/bold]")
+        rich_print(self.course_toc)
+
+        weeks = []
+        for week_name in self.course_toc:
+            weeks.append(await self._agenerate_week(week_name))
+
+        # wait for all scheduled slides, results are collected in planning order
+        for week_item_result, tasks in self._pending_week_items:
+            week_item_result.items = list(await asyncio.gather(*tasks))
+
+        self.course_result = CourseResult(
+            name=self.course_name,
+            toc=self.course_toc_resp,
+            weeks=weeks,
+        )
+
+    async def _agenerate_week(self, week_name: str) -> CourseWeekResult:
+        # prevent duplicate entries
+        self.previous_week_toc.append(week_name)
+        self._aggregate_week_header(week_name, week_name)
+        self.logger.debug("previous_week_toc")
+        self.logger.debug(self.previous_week_toc)
+
+        week_toc_response = await self._aplan(
+            f"week_toc/{week_name}",
+            get_prompt_template("week_toc_prompt").format(
+                week_name=week_name, previous_weeks_toc=str(self.previous_week_item_toc)
+            ),
+            "week_toc_prompt",
+        )
+        cur_week_toc = parse_markdown_list(week_toc_response)
+        self.logger.debug(cur_week_toc)
+
+        rich_print(
+            f"[bold]Generating week items for [green]{week_name}[/green] week [/bold]"
+        )
+        rich_print(cur_week_toc)
+
+        items = []
+        for week_item_name in cur_week_toc:
+            items.append(await self._agenerate_week_item(week_item_name))
+
+        return CourseWeekResult(name=week_name, toc=week_name, items=items)
+
+    async def _agenerate_week_item(self, week_item_name: str) -> CourseWeekItemResult:
+        # prevent duplicate entries
+        self.previous_week_item_toc.append(week_item_name)
+        self._aggregate_header(f"## {week_item_name}", week_item_name)
+        self.logger.debug("previous_week_item_toc")
+        self.logger.debug(self.previous_week_item_toc)
+
+        week_item_toc = await self._aplan(
+            f"week_item_toc/{self.previous_week_toc[-1]}/{week_item_name}",
+            get_prompt_template("week_item_toc_prompt").format(
+                week_name=self.previous_week_toc[-1],
+                week_item_name=week_item_name,
+                previous_week_items_toc=str(self.previous_key_point),
+            ),
+            "week_item_toc_prompt",
+        )
+        cur_week_item_toc = parse_markdown_list(week_item_toc)
+        self.logger.debug(cur_week_item_toc)
+
+        rich_print(
+            f"[bold]Scheduling key points for [green]{week_item_name}[/green] week item[/bold]"
+        )
+        rich_print(cur_week_item_toc)
+
+        # key points are filled in once the scheduled slides are done
+        week_item_result = CourseWeekItemResult(
+            name=week_item_name, toc=week_item_name, items=[]
+        )
+        # classified in the background, so planning the next week item is not delayed
+        key_point_types = None
+        if not runtime_config.SKIP_PROJECT:
+            key_point_types = asyncio.create_task(
+                self._aclassify_key_points(
+                    f"classify/{self.previous_week_toc[-1]}/{week_item_name}",
+                    cur_week_item_toc,
+                )
+            )
+        tasks = []
+        for key_point in cur_week_item_toc:
+            # prevent duplicate entries, appended in planning order
+            self.previous_key_point.append(key_point)
+            # slides are appended to the deck in planning order, whenever they finish
+            slot = self.aggregator.reserve()
+            tasks.append(
+                asyncio.create_task(
+                    self._agenerate_course_file(key_point, slot, key_point_types)
+                )
+            )
+        self._pending_week_items.append((week_item_result, tasks))
+
+        return week_item_result
+
+    async def _aclassify_key_points(
+        self, checkpoint_key: str, key_points: list[str]
+    ) -> dict[str, str]:
+        pending = self._pending_key_points(key_points)
+        if not pending:
+            return {}
+        answer = await self._aplan(
+            checkpoint_key,
+            _format_batch_classification_query(pending),
+            "batch_is_concept_or_project_prompt",
+        )
+        return _parse_key_point_types(answer, pending)
+
+    async def _agenerate_course_file(
+        self,
+        key_point: str,
+        slot: int,
+        key_point_types: "asyncio.Task[dict[str, str]] | None" = None,
+    ) -> KeyPoint:
+        with span("key_point", "slide", key_point=key_point):
+            return await self._agenerate_key_point(key_point, slot, key_point_types)
+
+    async def _agenerate_key_point(
+        self,
+        key_point: str,
+        slot: int,
+        key_point_types: "asyncio.Task[dict[str, str]] | None" = None,
+    ) -> KeyPoint:
+        checkpoint_key = f"key_point/{key_point}"
+        finished_key_point = self.checkpoint.get_key_point(checkpoint_key)
+        if finished_key_point is not None:
+            rich_print(f"Skipping finished slides for {key_point}")
+            self._aggregate_key_point(slot, finished_key_point)
+            return finished_key_point
+        key_point_type = "concept"
+        if key_point_types is not None:
+            key_point_type = (await key_point_types).get(key_point)
+        if key_point_type is None:
+            key_point_type = _normalize_key_point_type(
+                await self._ainvoke(
+                    get_prompt_template("is_concept_or_project_prompt").format(
+                        key_point=key_point
+                    ),
+                    "is_concept_or_project_prompt",
+                )
+            )
+            self.logger.debug(f"{key_point} is {key_point_type}")
+
+        final_path = f"{self.dist_dir}/{key_point}.md"
+        self.logger.debug(f"final_path: {final_path}")
+
+        if key_point_type == "concept":
+            prompt_name = "concept_slide_prompt"
+        else:
+            prompt_name = "project_slide_prompt"
+        query = get_prompt_template(prompt_name).format(key_point=key_point)
+        if runtime_config.STREAM:
+            async with self._semaphore:
+                await self._astream_result_to_file(
+                    self.rag_chain.astream(query), final_path, key_point
+                )
+        else:
+            slide = await self._ainvoke(query, prompt_name)
+            self.logger.debug(f"{key_point} slide:\n{slide}")
+            self._write_result_to_file(slide, final_path)
+        rich_print(f"Generated slides for {key_point}")
+
+        key_point_result = KeyPoint(
+            name=key_point, path=final_path, type=key_point_type
+        )
+        self.checkpoint.complete_key_point(checkpoint_key, key_point_result)
+        self._aggregate_key_point(slot, key_point_result)
+        return key_point_result
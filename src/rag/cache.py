@@ -0,0 +1,216 @@
+"""
+persistent caches for the generate path
+- LLM responses shared by every algorithm
+- retrieved contexts of the RAG chain
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+from src.config import cache_config
+from src.log import get_logger
+from src.tracing import count
+
+# name of the prompt file the current LLM call is rendered from
+_prompt_name: ContextVar[str | None] = ContextVar("prompt_name", default=None)
+
+
+@contextmanager
+def prompt_scope(prompt_name: str):
+    """
+    tag the responses cached inside this block with `prompt_name`,
+    so they can be invalidated when only that prompt changes
+    """
+    token = _prompt_name.set(prompt_name)
+    try:
+        yield
+    finally:
+        _prompt_name.reset(token)
+
+
+class ResponseCache(BaseCache):
+    """
+    SQLite-backed LLM cache keyed by sha256(model parameters + rendered prompt),
+    the rendered prompt already contains the retrieved context
+    """
+
+    def __init__(self, cache_path: str) -> None:
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                prompt_name TEXT,
+                response TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_prompt_name ON responses (prompt_name)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?",
+                (self._key(prompt, llm_string),),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            count("llm_cache_misses")
+            return None
+        self.hits += 1
+        count("llm_cache_hits")
+        return loads(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt_name, response, created) VALUES (?, ?, ?, ?)",
+                (
+                    self._key(prompt, llm_string),
+                    _prompt_name.get(),
+                    dumps(list(return_val)),
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def invalidate(self, prompt_name: str) -> int:
+        """
+        drop every response rendered from `prompt_name`
+        :return: number of dropped responses
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM responses WHERE prompt_name = ?", (prompt_name,)
+            ).rowcount
+            self._conn.commit()
+        get_logger().debug(f"Invalidated {deleted} cached {prompt_name} responses")
+        return deleted
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+@cache
+def get_response_cache() -> ResponseCache | None:
+    if not cache_config.LLM_CACHE:
+        return None
+    return ResponseCache(f"{cache_config.FOLDER}/responses.sqlite3")
+
+
+class ContextCache:
+    """
+    LRU cache of formatted retrieval contexts keyed by (collection, collection version, query)
+    - optionally persisted to SQLite, so later runs skip the query embedding and the search
+    - the collection version changes on every `load` and `delete`, which invalidates old entries
+    """
+
+    def __init__(self, max_size: int, cache_path: str | None = None) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS contexts (
+                    key TEXT PRIMARY KEY,
+                    collection_name TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    context TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS contexts_version ON contexts (collection_name, version)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _key(collection_name: str, version: str, query: str) -> str:
+        return hashlib.sha256(
+            f"{collection_name}\0{version}\0{query}".encode()
+        ).hexdigest()
+
+    def get(self, collection_name: str, version: str, query: str) -> str | None:
+        key = self._key(collection_name, version, query)
+        with self._lock:
+            context = self._entries.get(key)
+            if context is not None:
+                self._entries.move_to_end(key)
+            elif self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT context FROM contexts WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    context = row[0]
+                    self._remember(key, context)
+        if context is None:
+            self.misses += 1
+            count("context_cache_misses")
+        else:
+            self.hits += 1
+            count("context_cache_hits")
+        return context
+
+    def set(self, collection_name: str, version: str, query: str, context: str):
+        key = self._key(collection_name, version, query)
+        with self._lock:
+            self._remember(key, context)
+            if self._conn is not None:
+                # entries of older versions can never be hit again
+                self._conn.execute(
+                    "DELETE FROM contexts WHERE collection_name = ? AND version != ?",
+                    (collection_name, version),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO contexts (key, collection_name, version, context) VALUES (?, ?, ?, ?)",
+                    (key, collection_name, version, context),
+                )
+                self._conn.commit()
+
+    def _remember(self, key: str, context: str):
+        self._entries[key] = context
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+@cache
+def get_context_cache() -> ContextCache:
+    cache_path = None
+    if cache_config.RETRIEVAL_CACHE_PERSIST:
+        cache_path = f"{cache_config.FOLDER}/contexts.sqlite3"
+    return ContextCache(cache_config.RETRIEVAL_CACHE_SIZE, cache_path)
@@ -1,7 +1,12 @@
 from typing import List
 
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import (
+    Runnable,
+    RunnableConfig,
+    RunnableLambda,
+    RunnablePassthrough,
+)
 
 # for typing
 from langchain_openai import ChatOpenAI
@@ -9,28 +14,73 @@ from langchain_core.documents import Document
 from langchain_core.vectorstores import VectorStoreRetriever
 
 
+from src.config import runtime_config
+from src.rag.cache import get_context_cache
+from src.rag.context import format_docs, get_packing_fingerprint
+from src.rag.manifest import get_collection_version
+from src.tracing import span
 from src.rag.prompts import (
-    course_toc_prompt,
-    week_toc_prompt,
-    week_item_toc_prompt,
-    is_concept_or_project_prompt,
-    concept_slide_prompt,
-    project_slide_prompt,
-    rag_prompt,
-    rag_without_question_prompt,
+    get_prompt,
+    get_rag_prompt,
+    get_rag_without_question_prompt,
 )
 
 
 def _format_docs(docs: List[Document]):
-    return "\n\n".join(doc.page_content for doc in docs)
+    return format_docs(docs)
+
+
+def get_cached_context(
+    retriever: VectorStoreRetriever, collection_name: str
+) -> Runnable:
+    """
+    `retriever | _format_docs`, answered from the context cache when the same query
+    was already retrieved from the same version of the collection
+    """
+    context_cache = get_context_cache()
+    # a context retrieved from another storage backend or packed with other settings
+    # must not be served from the cache
+    version = (
+        f"{runtime_config.STORAGE.value}:{get_collection_version(collection_name)}"
+        f":{get_packing_fingerprint()}"
+    )
+
+    def retrieve(query: str, config: RunnableConfig) -> str:
+        with span("retrieve", "retriever", collection=collection_name) as current:
+            context = context_cache.get(collection_name, version, query)
+            current.set(cached=context is not None)
+            if context is None:
+                docs = retriever.invoke(query, config)
+                current.set(documents=len(docs))
+                context = _format_docs(docs)
+                context_cache.set(collection_name, version, query, context)
+            return context
+
+    async def aretrieve(query: str, config: RunnableConfig) -> str:
+        with span("retrieve", "retriever", collection=collection_name) as current:
+            context = context_cache.get(collection_name, version, query)
+            current.set(cached=context is not None)
+            if context is None:
+                docs = await retriever.ainvoke(query, config)
+                current.set(documents=len(docs))
+                context = _format_docs(docs)
+                context_cache.set(collection_name, version, query, context)
+            return context
+
+    return RunnableLambda(retrieve, afunc=aretrieve, name="cached_context")
 
 
 def get_rag_chain(
-    retriever: VectorStoreRetriever, llm: ChatOpenAI
+    retriever: VectorStoreRetriever,
+    llm: ChatOpenAI,
+    collection_name: str | None = None,
 ) -> RunnablePassthrough:
+    context = retriever | _format_docs
+    if collection_name is not None:
+        context = get_cached_context(retriever, collection_name)
     rag_chain = (
-        {"context": retriever | _format_docs, "question": RunnablePassthrough()}
-        | rag_prompt
+        {"context": context, "question": RunnablePassthrough()}
+        | get_rag_prompt()
         | llm
         | StrOutputParser()
     )
@@ -42,8 +92,8 @@ def get_course_toc_chain(retriever: VectorStoreRetriever, llm: ChatOpenAI):
         {
             "context": retriever | _format_docs,
         }
-        | rag_without_question_prompt
-        | course_toc_prompt
+        | get_rag_without_question_prompt()
+        | get_prompt("course_toc_prompt")
         | llm
         | StrOutputParser()
     )
@@ -55,8 +105,8 @@ def get_week_toc_chain(retriever: VectorStoreRetriever, llm: ChatOpenAI):
         {
             "context": retriever | _format_docs,
         }
-        | rag_without_question_prompt
-        | week_toc_prompt
+        | get_rag_without_question_prompt()
+        | get_prompt("week_toc_prompt")
         | llm
         | StrOutputParser()
     )
@@ -73,8 +123,8 @@ def get_week_item_toc_chain(
             "week_name": RunnablePassthrough(),
             "week_item_name": RunnablePassthrough(),
         }
-        | rag_without_question_prompt
-        | week_item_toc_prompt
+        | get_rag_without_question_prompt()
+        | get_prompt("week_item_toc_prompt")
         | llm
         | StrOutputParser()
     )
@@ -84,8 +134,8 @@ def get_week_item_toc_chain(
 def get_is_concept_or_project_chain(retriever: VectorStoreRetriever, llm: ChatOpenAI):
     rag_chain = (
         {"context": retriever | _format_docs, "key_point": RunnablePassthrough()}
-        | rag_without_question_prompt
-        | is_concept_or_project_prompt
+        | get_rag_without_question_prompt()
+        | get_prompt("is_concept_or_project_prompt")
         | llm
         | StrOutputParser()
     )
@@ -95,8 +145,8 @@ def get_is_concept_or_project_chain(retriever: VectorStoreRetriever, llm: ChatOp
 def get_concept_slide_chain(retriever: VectorStoreRetriever, llm: ChatOpenAI):
     rag_chain = (
         {"context": retriever | _format_docs, "key_point": RunnablePassthrough()}
-        | rag_without_question_prompt
-        | concept_slide_prompt
+        | get_rag_without_question_prompt()
+        | get_prompt("concept_slide_prompt")
         | llm
         | StrOutputParser()
     )
@@ -106,8 +156,8 @@ def get_concept_slide_chain(retriever: VectorStoreRetriever, llm: ChatOpenAI):
 def get_project_slide_chain(retriever: VectorStoreRetriever, llm: ChatOpenAI):
     rag_chain = (
         {"context": retriever | _format_docs, "project_name": RunnablePassthrough()}
-        | rag_without_question_prompt
-        | project_slide_prompt
+        | get_rag_without_question_prompt()
+        | get_prompt("project_slide_prompt")
         | llm
         | StrOutputParser()
     )
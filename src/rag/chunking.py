@@ -0,0 +1,199 @@
+"""
+pack the segments of a file, sentences of a transcript or blocks of a page, into
+chunks of at most `chunking_config.MAX_TOKENS` tokens
+- a segment is only cut when it alone is too long, at sentence ends first
+- a chunk ends before a segment starting a section or a paragraph once it holds
+  `chunking_config.MIN_TOKENS` tokens, so small sections are packed together
+- the last segments of a chunk, up to `chunking_config.OVERLAP_TOKENS` tokens, start
+  the next chunk too, unless the next chunk is under other headings
+- chunks keep the headings shared by their segments and the time range of their cues
+"""
+
+import re
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator, List
+
+from langchain_core.documents import Document
+
+from src.config import chunking_config
+from src.rag.context import count_tokens
+
+HEADINGS_SEPARATOR = " > "
+
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?…])[\"')\]]*\s+")
+_WORD_PATTERN = re.compile(r"\S+")
+
+
+@dataclass
+class Segment:
+    text: str
+    # joins the segment to the previous one in the text of the file
+    separator: str = " "
+    # the segment starts a section or a paragraph, a good place to end a chunk
+    boundary: bool = False
+    headings: tuple[str, ...] = ()
+    start_time: float | None = None
+    end_time: float | None = None
+
+
+@dataclass
+class _Packed:
+    segment: Segment
+    # offset of the segment in the text of the file
+    offset: int
+    tokens: int
+
+
+def _get_spans(text: str, max_tokens: int) -> Iterator[tuple[int, int, int]]:
+    """
+    :return: start, end and tokens of the sentences of `text`, of its words when
+    a sentence alone is longer than `max_tokens`
+    """
+    start = 0
+    ends = [
+        # closing quotes and brackets belong to the sentence
+        match.start() + len(match.group(0).rstrip())
+        for match in SENTENCE_END_PATTERN.finditer(text)
+    ]
+    for end in ends + [len(text)]:
+        sentence = text[start:end]
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            yield start, end, tokens
+        else:
+            for word in _WORD_PATTERN.finditer(sentence):
+                yield (
+                    start + word.start(),
+                    start + word.end(),
+                    count_tokens(word.group(0)),
+                )
+        # skip the whitespace after the sentence end
+        match = _WORD_PATTERN.search(text, end)
+        start = match.start() if match else len(text)
+
+
+def _split(segment: Segment, max_tokens: int) -> Iterator[tuple[Segment, int]]:
+    """
+    cut a segment longer than `max_tokens` into pieces of whole sentences or words,
+    the whitespace between two pieces is the separator of the second one
+    :return: the pieces and their tokens
+    """
+    tokens = count_tokens(segment.text)
+    if tokens <= max_tokens:
+        yield segment, tokens
+        return
+    text = segment.text
+    piece_start = piece_end = None
+    previous_end = None
+    used = 0
+
+    def piece() -> Segment:
+        if previous_end is None:
+            return replace(segment, text=text[piece_start:piece_end])
+        return replace(
+            segment,
+            text=text[piece_start:piece_end],
+            separator=text[previous_end:piece_start],
+            boundary=False,
+        )
+
+    for start, end, tokens in _get_spans(text, max_tokens):
+        if piece_start is not None and used + tokens > max_tokens:
+            yield piece(), used
+            previous_end = piece_end
+            piece_start = None
+            used = 0
+        if piece_start is None:
+            piece_start = start
+        piece_end = end
+        used += tokens
+    if piece_start is not None:
+        yield piece(), used
+
+
+def _common_headings(chunk: List[_Packed]) -> tuple[str, ...]:
+    headings = chunk[0].segment.headings
+    for packed in chunk[1:]:
+        other = packed.segment.headings
+        size = 0
+        while size < min(len(headings), len(other)) and headings[size] == other[size]:
+            size += 1
+        headings = headings[:size]
+    return headings
+
+
+def _to_document(chunk: List[_Packed], source: str) -> Document:
+    parts = [chunk[0].segment.text]
+    for packed in chunk[1:]:
+        parts.append(packed.segment.separator)
+        parts.append(packed.segment.text)
+    metadata = {"source": source, "start_index": chunk[0].offset}
+    headings = _common_headings(chunk)
+    if headings:
+        metadata["headings"] = HEADINGS_SEPARATOR.join(headings)
+    start_times = [
+        packed.segment.start_time
+        for packed in chunk
+        if packed.segment.start_time is not None
+    ]
+    end_times = [
+        packed.segment.end_time
+        for packed in chunk
+        if packed.segment.end_time is not None
+    ]
+    if start_times:
+        metadata["start_time"] = start_times[0]
+    if end_times:
+        metadata["end_time"] = end_times[-1]
+    return Document(page_content="".join(parts), metadata=metadata)
+
+
+def _get_overlap(chunk: List[_Packed], segment: Segment) -> List[_Packed]:
+    """
+    the last segments of `chunk` repeated at the start of the next chunk
+    """
+    if chunk[-1].segment.headings != segment.headings:
+        return []
+    overlap = []
+    used = 0
+    for packed in reversed(chunk[1:]):
+        if used + packed.tokens > chunking_config.OVERLAP_TOKENS:
+            break
+        overlap.insert(0, packed)
+        used += packed.tokens
+    return overlap
+
+
+def pack_segments(segments: Iterable[Segment], source: str) -> Iterator[Document]:
+    """
+    pack `segments`, in the order of the file, into chunks
+    - `start_index` is the offset of a chunk in the text of the file, the segments
+      joined by their separators, like the text splitter adds it
+    """
+    max_tokens = max(1, chunking_config.MAX_TOKENS)
+    chunk: List[_Packed] = []
+    used = 0
+    # segments of the chunk which were not in the previous one
+    fresh = 0
+    offset = None
+    for segment in segments:
+        for piece, tokens in _split(segment, max_tokens):
+            offset = 0 if offset is None else offset + len(piece.separator)
+            packed = _Packed(piece, offset, tokens)
+            offset += len(piece.text)
+            if fresh and (
+                used + tokens > max_tokens
+                or (piece.boundary and used >= chunking_config.MIN_TOKENS)
+            ):
+                yield _to_document(chunk, source)
+                chunk = _get_overlap(chunk, piece)
+                used = sum(item.tokens for item in chunk)
+                fresh = 0
+                # the overlap never pushes a chunk over the limit
+                while chunk and used + tokens > max_tokens:
+                    used -= chunk.pop(0).tokens
+            chunk.append(packed)
+            used += tokens
+            fresh += 1
+    if fresh:
+        yield _to_document(chunk, source)
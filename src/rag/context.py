@@ -0,0 +1,191 @@
+"""
+pack retrieved chunks into the prompt context
+- overlapping chunks of the same source are merged using their `start_index`
+- near-duplicates, e.g. the `.srt` transcript and `.html` note of a lecture, are dropped
+- chunks are added in retrieval order until the token budget is spent
+"""
+
+import threading
+from dataclasses import dataclass
+from functools import cache
+from typing import List
+
+from langchain_core.documents import Document
+
+from src.config import context_config
+from src.log import get_logger
+from src.tracing import count
+
+SEPARATOR = "\n\n"
+
+
+@cache
+def _get_encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(context_config.ENCODING)
+    except Exception as e:
+        # tiktoken is optional and downloads its encodings on first use
+        get_logger().debug(f"Counting tokens as characters / 4, no tiktoken: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _truncate(text: str, tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[: tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+
+
+@dataclass
+class _Block:
+    rank: int
+    text: str
+    source: str | None = None
+    start: int | None = None
+
+    @property
+    def end(self) -> int | None:
+        return None if self.start is None else self.start + len(self.text)
+
+
+def _merge_overlapping(docs: List[Document]) -> List[_Block]:
+    """
+    merge chunks of the same source whose character ranges touch or overlap,
+    a merged block keeps the best rank of its chunks
+    """
+    blocks = []
+    by_source: dict[str, list[_Block]] = {}
+    for rank, doc in enumerate(docs):
+        block = _Block(
+            rank=rank,
+            text=doc.page_content,
+            source=doc.metadata.get("source"),
+            start=doc.metadata.get("start_index"),
+        )
+        if block.source is None or block.start is None:
+            blocks.append(block)
+        else:
+            by_source.setdefault(block.source, []).append(block)
+
+    for source_blocks in by_source.values():
+        source_blocks.sort(key=lambda block: block.start)
+        current = source_blocks[0]
+        for block in source_blocks[1:]:
+            if block.start <= current.end:
+                if block.end > current.end:
+                    current.text += block.text[current.end - block.start :]
+                current.rank = min(current.rank, block.rank)
+            else:
+                blocks.append(current)
+                current = block
+        blocks.append(current)
+
+    blocks.sort(key=lambda block: block.rank)
+    return blocks
+
+
+def _shingles(text: str) -> set[int]:
+    words = text.lower().split()
+    size = context_config.SHINGLE_SIZE
+    if len(words) <= size:
+        return {hash(" ".join(words))}
+    return {hash(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+def _drop_duplicates(blocks: List[_Block]) -> List[_Block]:
+    """
+    drop blocks whose shingles mostly appear in a better ranked block already
+    """
+    kept = []
+    kept_shingles = []
+    for block in blocks:
+        shingles = _shingles(block.text)
+        duplicate = any(
+            len(shingles & other) / min(len(shingles), len(other))
+            >= context_config.DUPLICATE_THRESHOLD
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(block)
+            kept_shingles.append(shingles)
+    return kept
+
+
+class ContextPacker:
+    """
+    format retrieved documents into a context of at most `token_budget` tokens,
+    and count the tokens saved compared to joining every document
+    """
+
+    def __init__(self, token_budget: int) -> None:
+        self.token_budget = token_budget
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+    def pack(self, docs: List[Document]) -> str:
+        texts = []
+        used = 0
+        separator_tokens = count_tokens(SEPARATOR)
+        for block in _drop_duplicates(_merge_overlapping(docs)):
+            tokens = count_tokens(block.text) + (separator_tokens if texts else 0)
+            if used + tokens > self.token_budget:
+                if not texts:
+                    # never answer from an empty context, cut the best block instead
+                    texts.append(_truncate(block.text, self.token_budget))
+                    used = self.token_budget
+                continue
+            texts.append(block.text)
+            used += tokens
+        context = SEPARATOR.join(texts)
+
+        tokens_in = count_tokens(SEPARATOR.join(doc.page_content for doc in docs))
+        tokens_out = count_tokens(context)
+        with self._lock:
+            self.calls += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+        count("packed_tokens_in", tokens_in)
+        count("packed_tokens_out", tokens_out)
+        get_logger().debug(
+            f"Packed {len(docs)} chunks into {len(texts)} blocks, "
+            f"{tokens_in} -> {tokens_out} tokens"
+        )
+        return context
+
+
+@cache
+def get_context_packer() -> ContextPacker:
+    return ContextPacker(token_budget=context_config.TOKEN_BUDGET)
+
+
+def get_packing_fingerprint() -> str:
+    """
+    packing settings that change the packed context, for cache keys
+    """
+    if not context_config.PACKING:
+        return "join"
+    return (
+        f"pack:{context_config.TOKEN_BUDGET}:{context_config.RETRIEVER_K}:"
+        f"{context_config.DUPLICATE_THRESHOLD}:{context_config.SHINGLE_SIZE}"
+    )
+
+
+def format_docs(docs: List[Document]) -> str:
+    if not context_config.PACKING:
+        return SEPARATOR.join(doc.page_content for doc in docs)
+    return get_context_packer().pack(docs)
@@ -1,49 +1,130 @@
+from typing import Callable
+
+from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 from langchain_core.vectorstores import VectorStoreRetriever
 
-from .loader import get_documents
-from .vector_database import get_langchain_chroma
-from .embedding import openai_embedding
-from ..log import get_logger, rich_print
-from src.config import runtime_config
-
-
-def save_file(
-    collection_name: str,
-    path: str,
-):
-    documents = get_documents(path)
-    langchain_chroma = get_langchain_chroma(
-        collection_name=collection_name,
-        embeddings=openai_embedding,
-    )
-    # update the database
-    if runtime_config.VERBOSE:
-        rich_print(
-            f"Adding documents [bold]{path.split('/')[-1]}[/bold] to collection [bold]{collection_name}[/bold]"
-        )
-    else:
-        rich_print(f"Processing [bold]{path.split('/')[-1]}[/bold]")
-
-    try:
-        langchain_chroma.add_documents(documents=documents)
-    except Exception as e:
-        rich_print(f"Error adding documents to collection {collection_name}")
-        rich_print(e)
-        return
+from .vector_database import get_vector_store
+from .embedding import get_openai_embedding
+from ..log import get_logger
+from .cache import get_response_cache
+from .scheduler import get_scheduler
+from src.config import context_config, scheduler_config
+from src.rag.context import count_tokens
+from src.tracing import get_callbacks
 
 
 def get_retriever(
     collection_name: str,
 ) -> VectorStoreRetriever:
     get_logger().debug(f"Getting retriever from {collection_name}")
-    langchain_chroma = get_langchain_chroma(
+    vector_store = get_vector_store(
         collection_name=collection_name,
-        embeddings=openai_embedding,
+        embeddings=get_openai_embedding(),
     )
-    return langchain_chroma.as_retriever()
+    if not context_config.PACKING:
+        return vector_store.as_retriever()
+    # packing drops overlaps and duplicates, retrieve more candidates to fill the budget
+    return vector_store.as_retriever(search_kwargs={"k": context_config.RETRIEVER_K})
+
+
+def _pop_headers(generation) -> dict | None:
+    """
+    take the rate limit headers out of a generation, they are not part of the answer
+    """
+    headers = None
+    if generation.generation_info:
+        headers = generation.generation_info.pop("headers", None)
+    response_metadata = getattr(generation.message, "response_metadata", None)
+    if response_metadata:
+        headers = response_metadata.pop("headers", None) or headers
+    return headers
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """
+    `ChatOpenAI` whose requests go through the process-wide scheduler, which bounds
+    concurrency, requests and tokens per minute and retries rate limited requests
+    - cached responses are answered before and never wait
+    """
+
+    include_response_headers: bool = True
+    # retried by the scheduler, which knows about the other in-flight requests
+    max_retries: int = 0
+
+    def _estimate_tokens(self, messages) -> int:
+        prompt_tokens = sum(count_tokens(str(message.content)) for message in messages)
+        return prompt_tokens + (self.max_tokens or scheduler_config.COMPLETION_TOKENS)
+
+    def _observe_result(self, slot, result):
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        headers = _pop_headers(result.generations[0]) if result.generations else None
+        slot.observe(headers, usage.get("total_tokens"))
+
+    def _generate(self, messages, *args, **kwargs):
+        def generate(slot):
+            result = super(ScheduledChatOpenAI, self)._generate(
+                messages, *args, **kwargs
+            )
+            self._observe_result(slot, result)
+            return result
+
+        return get_scheduler().call(generate, self._estimate_tokens(messages))
+
+    async def _agenerate(self, messages, *args, **kwargs):
+        async def agenerate(slot):
+            result = await super(ScheduledChatOpenAI, self)._agenerate(
+                messages, *args, **kwargs
+            )
+            self._observe_result(slot, result)
+            return result
+
+        return await get_scheduler().acall(agenerate, self._estimate_tokens(messages))
+
+    def _stream(self, messages, *args, **kwargs):
+        def stream(slot):
+            for chunk in super(ScheduledChatOpenAI, self)._stream(
+                messages, *args, **kwargs
+            ):
+                headers = _pop_headers(chunk)
+                if headers:
+                    slot.observe(headers)
+                yield chunk
+
+        yield from get_scheduler().iterate(stream, self._estimate_tokens(messages))
+
+    async def _astream(self, messages, *args, **kwargs):
+        async def astream(slot):
+            async for chunk in super(ScheduledChatOpenAI, self)._astream(
+                messages, *args, **kwargs
+            ):
+                headers = _pop_headers(chunk)
+                if headers:
+                    slot.observe(headers)
+                yield chunk
+
+        async for chunk in get_scheduler().aiterate(
+            astream, self._estimate_tokens(messages)
+        ):
+            yield chunk
+
+
+_llm_factory: Callable[..., BaseChatModel] | None = None
+
+
+def set_llm_factory(factory: Callable[..., BaseChatModel] | None):
+    """
+    replace the model returned by `get_llm`, e.g. by a fake model for benchmarks
+    - the factory is called with the `cache` and `callbacks` of the model
+    - `None` restores `ScheduledChatOpenAI`
+    """
+    global _llm_factory
+    _llm_factory = factory
 
 
 def get_llm():
-    llm = ChatOpenAI(model="gpt-3.5-turbo")
+    kwargs = {"cache": get_response_cache(), "callbacks": get_callbacks()}
+    if _llm_factory is not None:
+        return _llm_factory(**kwargs)
+    llm = ScheduledChatOpenAI(model="gpt-3.5-turbo", **kwargs)
     return llm
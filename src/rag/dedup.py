@@ -0,0 +1,222 @@
+"""
+near-duplicate chunks, e.g. a recap lecture or the boilerplate of quiz pages, are
+skipped by `load` before they are embedded
+- every chunk is fingerprinted with a MinHash signature of its word shingles
+- a per-collection LSH index finds the stored chunks sharing a band of the signature,
+  a chunk whose estimated similarity to one of them reaches `dedup_config.THRESHOLD`
+  is linked to that canonical chunk instead of being stored
+- the index is kept in `{cache_config.FOLDER}/dedup/{storage}/{collection}.npz`, next
+  to the manifest of the collection
+"""
+
+import os
+import re
+import zlib
+from functools import cache
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import cache_config, dedup_config, runtime_config
+from src.log import get_logger
+
+# odd multiplier combining the word hashes of a shingle
+_SHINGLE_MULTIPLIER = np.uint64(1_000_003)
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def get_dedup_fingerprint() -> str:
+    """
+    settings that change which chunks are stored
+    """
+    if not dedup_config.ENABLED:
+        return "dedup:off"
+    return (
+        f"dedup:{dedup_config.NUM_PERM}:{dedup_config.BANDS}"
+        f":{dedup_config.SHINGLE_SIZE}:{dedup_config.THRESHOLD}"
+    )
+
+
+@cache
+def _get_permutations(num_perm: int) -> tuple[np.ndarray, np.ndarray]:
+    # a fixed seed, signatures are persisted and compared across runs
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def _get_shingles(text: str) -> np.ndarray:
+    """
+    :return: the distinct hashes of the word shingles of `text`
+    """
+    # punctuation and case differ between a transcript and the notes of a lecture,
+    # crc32 instead of `hash`, which is salted per process
+    words = np.array(
+        [zlib.crc32(word.encode()) for word in _WORD_PATTERN.findall(text.lower())],
+        dtype=np.uint64,
+    )
+    size = min(dedup_config.SHINGLE_SIZE, len(words))
+    if size == 0:
+        return np.zeros(1, dtype=np.uint64)
+    count = len(words) - size + 1
+    # the products wrap around like 64-bit integers, which is fine for hashing
+    shingles = words[:count].copy()
+    for offset in range(1, size):
+        shingles = shingles * _SHINGLE_MULTIPLIER + words[offset : offset + count]
+    return np.unique(shingles)
+
+
+def get_signatures(texts: List[str]) -> np.ndarray:
+    """
+    :return: uint32 matrix of the MinHash signatures of `texts`, one row per text
+    """
+    a, b = _get_permutations(dedup_config.NUM_PERM)
+    signatures = np.empty((len(texts), dedup_config.NUM_PERM), dtype=np.uint32)
+    for row, text in enumerate(texts):
+        shingles = _get_shingles(text)
+        # multiply-shift hashing, one hash function per permutation
+        hashes = (np.outer(shingles, a) + b) >> np.uint64(32)
+        signatures[row] = hashes.min(axis=0)
+    return signatures
+
+
+class DedupIndex:
+    def __init__(self, collection_name: str) -> None:
+        self.collection_name = collection_name
+        # canonical chunks, stored in the collection
+        self._signatures: dict[str, np.ndarray] = {}
+        self._buckets: dict[tuple[int, bytes], list[str]] = {}
+        # skipped chunk id -> canonical chunk id and source of the skipped chunk
+        self._links: dict[str, tuple[str, str]] = {}
+
+    @staticmethod
+    def get_path(collection_name: str) -> str:
+        return f"{cache_config.FOLDER}/dedup/{runtime_config.STORAGE.value}/{collection_name}.npz"
+
+    @classmethod
+    def load(cls, collection_name: str) -> "DedupIndex":
+        index = cls(collection_name)
+        path = cls.get_path(collection_name)
+        if not os.path.exists(path):
+            return index
+        with np.load(path, allow_pickle=False) as data:
+            signatures = data["signatures"]
+            if signatures.shape[1:] != (dedup_config.NUM_PERM,):
+                get_logger().debug(f"Discarding dedup index with other settings {path}")
+                return index
+            for chunk_id, signature in zip(data["ids"].tolist(), signatures):
+                index.add(chunk_id, signature)
+            index._links = {
+                duplicate_id: (canonical_id, source)
+                for duplicate_id, canonical_id, source in zip(
+                    data["duplicate_ids"].tolist(),
+                    data["canonical_ids"].tolist(),
+                    data["sources"].tolist(),
+                )
+            }
+        return index
+
+    def save(self):
+        path = self.get_path(self.collection_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        links = list(self._links.items())
+        # write to a temporary file first, so a crash never leaves a truncated index
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                ids=np.array(list(self._signatures), dtype=str),
+                signatures=np.array(
+                    list(self._signatures.values()), dtype=np.uint32
+                ).reshape(-1, dedup_config.NUM_PERM),
+                duplicate_ids=np.array([link[0] for link in links], dtype=str),
+                canonical_ids=np.array([link[1][0] for link in links], dtype=str),
+                sources=np.array([link[1][1] for link in links], dtype=str),
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def delete(cls, collection_name: str):
+        path = cls.get_path(collection_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _get_keys(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        rows = dedup_config.NUM_PERM // max(1, dedup_config.BANDS)
+        return [
+            (band, signature[band * rows : (band + 1) * rows].tobytes())
+            for band in range(dedup_config.NUM_PERM // rows)
+        ]
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        if chunk_id in self._signatures:
+            return
+        self._signatures[chunk_id] = signature
+        for key in self._get_keys(signature):
+            self._buckets.setdefault(key, []).append(chunk_id)
+
+    def _remove(self, chunk_id: str):
+        signature = self._signatures.pop(chunk_id)
+        for key in self._get_keys(signature):
+            bucket = self._buckets[key]
+            bucket.remove(chunk_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def find(self, chunk_id: str, signature: np.ndarray) -> str | None:
+        """
+        :return: the most similar canonical chunk above the threshold, if any
+        """
+        candidates = {
+            candidate
+            for key in self._get_keys(signature)
+            for candidate in self._buckets.get(key, ())
+            if candidate != chunk_id
+        }
+        best, best_similarity = None, dedup_config.THRESHOLD
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def filter(
+        self, source: str, documents: List[Document], signatures: np.ndarray
+    ) -> List[Document]:
+        """
+        link the near-duplicates among `documents` to their canonical chunks,
+        the others become canonical chunks
+        :return: the documents to store
+        """
+        kept = []
+        for document, signature in zip(documents, signatures):
+            canonical_id = self.find(document.id, signature)
+            if canonical_id is None:
+                self.add(document.id, signature)
+                kept.append(document)
+            else:
+                self._links[document.id] = (canonical_id, source)
+        return kept
+
+    def prune(self, stored_ids: set[str], reloaded: set[str]) -> list[str]:
+        """
+        forget the chunks which are no longer stored and the links of reloaded files
+        :return: the other files linked to a forgotten chunk, they must be reloaded
+        to store the chunks they skipped
+        """
+        for chunk_id in [
+            chunk_id for chunk_id in self._signatures if chunk_id not in stored_ids
+        ]:
+            self._remove(chunk_id)
+        orphans = {
+            source
+            for canonical_id, source in self._links.values()
+            if source not in reloaded and canonical_id not in self._signatures
+        }
+        self._links = {
+            duplicate_id: (canonical_id, source)
+            for duplicate_id, (canonical_id, source) in self._links.items()
+            if source not in reloaded and source not in orphans
+        }
+        return sorted(orphans)
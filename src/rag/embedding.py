@@ -1,8 +1,280 @@
-from langchain_openai import OpenAIEmbeddings
+"""
+embedding models, wrapped by a persistent content-addressed cache
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from functools import cache
+from typing import Callable, List
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import cache_config
+from src.log import get_logger
+from src.rag.context import count_tokens
+from src.rag.scheduler import get_scheduler
+from src.tracing import count, get_cost, span
+
 # from langchain_community.embeddings.sentence_transformer import (
 #     SentenceTransformerEmbeddings,
 # )
 
 
-openai_embedding = OpenAIEmbeddings()
+class CachedEmbeddings(Embeddings):
+    """
+    disk-backed embedding cache keyed by sha256(model name + chunk text)
+    - vectors are stored as float32 blobs in a SQLite database
+    - least recently used vectors are evicted once the cache exceeds `max_bytes`
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_path: str,
+        max_bytes: int,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model", type(embeddings).__name__)
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> dict[str, List[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # stay below SQLite's default limit of host parameters
+            for start in range(0, len(unique_keys), 500):
+                part = unique_keys[start : start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part,
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = array("f", vector).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, vectors: dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for key, vector in vectors.items():
+            blob = array("f", vector).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            for row in rows:
+                # a key stored by a concurrent miss keeps its vector and is counted once
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, accessed) VALUES (?, ?, ?, ?)",
+                    row,
+                )
+                if cursor.rowcount == 1:
+                    self._total_bytes += row[2]
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # drop least recently used vectors until the cache is back under 90% of its budget
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        rows = self._conn.execute(
+            "SELECT key, size FROM embeddings ORDER BY accessed ASC"
+        )
+        stale = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            stale.append((key,))
+            self._total_bytes -= size
+            evicted += 1
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        get_logger().debug(f"Evicted {evicted} embeddings from {self.cache_path}")
+
+    def _split(self, texts: List[str]) -> tuple[List[str], dict, dict]:
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for key in keys if key not in found)
+        self.misses += len(missing)
+        count("embedding_cache_hits", len(texts) - len(missing))
+        count("embedding_cache_misses", len(missing))
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await asyncio.to_thread(self._split, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self._store, computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            count("embedding_cache_hits")
+            return found[key]
+        self.misses += 1
+        count("embedding_cache_misses")
+        vector = self.embeddings.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = await asyncio.to_thread(self._lookup, [key])
+        if key in found:
+            self.hits += 1
+            count("embedding_cache_hits")
+            return found[key]
+        self.misses += 1
+        count("embedding_cache_misses")
+        vector = await self.embeddings.aembed_query(text)
+        await asyncio.to_thread(self._store, {key: vector})
+        return vector
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    embedding requests go through the process-wide scheduler, like LLM requests,
+    so they share the concurrency and rate budgets and are retried when rate limited
+    """
+
+    def __init__(self, embeddings: Embeddings) -> None:
+        self.embeddings = embeddings
+        # the cache keys vectors by the model name of the wrapped embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def _span(self, texts: List[str], tokens: int):
+        return span(
+            "embed",
+            "embedding",
+            model=self.model,
+            texts=len(texts),
+            tokens_in=tokens,
+            cost=get_cost(self.model, tokens, 0),
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = _count_tokens(texts)
+        with self._span(texts, tokens):
+            return get_scheduler().call(
+                lambda slot: self.embeddings.embed_documents(texts), tokens
+            )
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = _count_tokens(texts)
+        with self._span(texts, tokens):
+            return await get_scheduler().acall(
+                lambda slot: self.embeddings.aembed_documents(texts), tokens
+            )
+
+    def embed_query(self, text: str) -> List[float]:
+        tokens = _count_tokens([text])
+        with self._span([text], tokens):
+            return get_scheduler().call(
+                lambda slot: self.embeddings.embed_query(text), tokens
+            )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        tokens = _count_tokens([text])
+        with self._span([text], tokens):
+            return await get_scheduler().acall(
+                lambda slot: self.embeddings.aembed_query(text), tokens
+            )
+
+
+def _count_tokens(texts: List[str]) -> int:
+    return sum(count_tokens(text) for text in texts)
+
+
+def get_cached_embedding(embeddings: Embeddings) -> Embeddings:
+    if not cache_config.EMBEDDING_CACHE:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        cache_path=f"{cache_config.FOLDER}/embeddings.sqlite3",
+        max_bytes=cache_config.EMBEDDING_MAX_BYTES,
+    )
+
+
+_embedding_factory: Callable[[], Embeddings] | None = None
+
+
+def set_embedding_factory(factory: Callable[[], Embeddings] | None):
+    """
+    replace the embeddings wrapped by `get_openai_embedding`, e.g. by a fake model
+    for benchmarks, `None` restores `OpenAIEmbeddings`
+    """
+    global _embedding_factory
+    _embedding_factory = factory
+    get_openai_embedding.cache_clear()
+
+
+@cache
+def get_openai_embedding() -> Embeddings:
+    """
+    created on first use, so importing this module needs neither network nor API key
+    """
+    if _embedding_factory is not None:
+        return get_cached_embedding(ScheduledEmbeddings(_embedding_factory()))
+
+    from langchain_openai import OpenAIEmbeddings
+
+    # retried by the scheduler, which knows about the other in-flight requests
+    return get_cached_embedding(ScheduledEmbeddings(OpenAIEmbeddings(max_retries=0)))
+
+
 # sentence_transformer_embedding = SentenceTransformerEmbeddings()
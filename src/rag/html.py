@@ -0,0 +1,283 @@
+"""
+streaming extractor of the text of `.html` pages, section by section
+- the page is tokenized in blocks with regular expressions, no document tree is
+  built and attributes are never parsed, `html.parser` spends most of its time on them
+- `script`, `style`, `nav` and other boilerplate elements are skipped
+- every heading starts a section, the blocks of a section are packed into chunks by
+  `pack_segments` with the headings above them, e.g. `Week 1 > Loops`
+"""
+
+import html
+import re
+from typing import Iterator, List
+
+from langchain_core.documents import Document
+
+from src.rag.chunking import Segment, pack_segments
+
+READ_SIZE = 64 * 1024
+BLOCK_SEPARATOR = "\n\n"
+
+SKIPPED_TAGS = {
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "iframe",
+    "nav",
+    "aside",
+    "footer",
+}
+# their content is text up to the end tag, not markup
+RAW_TEXT_TAGS = {"script", "style"}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# tags whose start and end break the text into blocks
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "blockquote",
+    "body",
+    "dd",
+    "details",
+    "dialog",
+    "div",
+    "dl",
+    "dt",
+    "fieldset",
+    "figcaption",
+    "figure",
+    "form",
+    "header",
+    "hr",
+    "label",
+    "legend",
+    "li",
+    "main",
+    "ol",
+    "option",
+    "p",
+    "pre",
+    "section",
+    "summary",
+    "table",
+    "td",
+    "th",
+    "tr",
+    "ul",
+} | set(HEADING_TAGS)
+
+_SPACE_PATTERN = re.compile(r"\s+")
+# doctypes and processing instructions, or a start or end tag
+_TAG_PATTERN = re.compile(
+    r"<[!?][^>]*>"
+    r"|<(/?)([a-zA-Z][a-zA-Z0-9:-]*)(?:\"[^\"]*\"|'[^']*'|[^'\">])*>"
+)
+# a tag with an unbalanced quote, e.g. `<a title=don't>`
+_LOOSE_TAG_PATTERN = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9:-]*)[^>]*>")
+_RAW_TEXT_END_PATTERNS = {
+    tag: re.compile(rf"</{tag}\s*>", re.IGNORECASE) for tag in RAW_TEXT_TAGS
+}
+
+
+class _Section:
+    def __init__(self, headings: List[str]) -> None:
+        self.headings = headings
+        self.blocks: List[str] = []
+
+
+class _TextExtractor:
+    """
+    collect the text blocks of a page into sections, finished sections are taken
+    with `pop_sections` while the page is still being fed
+    """
+
+    def __init__(self) -> None:
+        # the rest of the fed text, from a tag which may still be incomplete
+        self._buffer = ""
+        self._raw_text_tag = None
+        self.title = ""
+        self._in_title = False
+        self._skip_depth = 0
+        # raw text of the current line, inline tags split it anywhere in a word
+        self._text: List[str] = []
+        self._lines: List[str] = []
+        # level of the heading being read, its text is collected like a line
+        self._heading_level = 0
+        self._headings: List[tuple[int, str]] = []
+        self._section = _Section([])
+        self._finished: List[_Section] = []
+
+    def feed(self, data: str) -> None:
+        self._buffer += data
+        # everything before the last `<` is complete, tags and entities included
+        self._parse(self._buffer.rfind("<"))
+
+    def close(self) -> None:
+        self._parse(len(self._buffer))
+        # an unclosed comment or raw text element is dropped
+        if (
+            self._buffer
+            and not self._raw_text_tag
+            and not self._buffer.startswith("<!--")
+        ):
+            self.handle_data(self._buffer)
+        self._buffer = ""
+        self._end_block()
+        self._finish_section()
+
+    def _parse(self, end: int) -> None:
+        buffer = self._buffer
+        position = 0
+        while position < end:
+            if self._raw_text_tag:
+                match = _RAW_TEXT_END_PATTERNS[self._raw_text_tag].search(
+                    buffer, position
+                )
+                if match is None:
+                    break
+                # the end tag is read as a tag
+                position = match.start()
+                self._raw_text_tag = None
+            start = buffer.find("<", position, end)
+            if start < 0:
+                start = end
+            if start > position:
+                self.handle_data(buffer[position:start])
+                position = start
+            if position >= end:
+                break
+            if buffer.startswith("<!--", position):
+                # comments may hold markup, e.g. conditional comments
+                comment_end = buffer.find("-->", position + 4)
+                if comment_end < 0:
+                    break
+                position = comment_end + 3
+                continue
+            match = _TAG_PATTERN.match(buffer, position) or _LOOSE_TAG_PATTERN.match(
+                buffer, position
+            )
+            if match is None:
+                # a lone `<`, e.g. `a < b`
+                self.handle_data("<")
+                position += 1
+                continue
+            position = match.end()
+            name = match.group(2)
+            if name is None:
+                continue
+            tag = name.lower()
+            if match.group(1):
+                self.handle_endtag(tag)
+            elif match.group(0).endswith("/>"):
+                self.handle_starttag(tag)
+                self.handle_endtag(tag)
+            else:
+                self.handle_starttag(tag)
+                if tag in RAW_TEXT_TAGS:
+                    self._raw_text_tag = tag
+        self._buffer = buffer[position:]
+
+    def handle_starttag(self, tag: str) -> None:
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif self._skip_depth:
+            return
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "br":
+            self._end_line()
+        elif tag in HEADING_TAGS:
+            self._end_block()
+            self._heading_level = HEADING_TAGS[tag]
+        elif tag in BLOCK_TAGS:
+            self._end_block()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif self._skip_depth:
+            return
+        elif tag == "title":
+            self._in_title = False
+        elif tag in HEADING_TAGS and self._heading_level:
+            self._end_heading()
+        elif tag in BLOCK_TAGS:
+            self._end_block()
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_depth:
+            return
+        data = html.unescape(data)
+        if self._in_title:
+            self.title += _SPACE_PATTERN.sub(" ", data)
+        else:
+            self._text.append(data)
+
+    def pop_sections(self) -> List[_Section]:
+        sections, self._finished = self._finished, []
+        return sections
+
+    def _end_line(self) -> None:
+        line = " ".join("".join(self._text).split())
+        self._text = []
+        if line:
+            self._lines.append(line)
+
+    def _end_block(self) -> None:
+        self._end_line()
+        if self._lines:
+            self._section.blocks.append("\n".join(self._lines))
+            self._lines = []
+
+    def _end_heading(self) -> None:
+        self._end_line()
+        text = " ".join(self._lines)
+        self._lines = []
+        level, self._heading_level = self._heading_level, 0
+        if not text:
+            return
+        self._finish_section()
+        self._headings = [
+            heading for heading in self._headings if heading[0] < level
+        ] + [(level, text)]
+        self._section = _Section([heading for _, heading in self._headings])
+        self._section.blocks.append(text)
+
+    def _finish_section(self) -> None:
+        if self._section.blocks:
+            self._finished.append(self._section)
+        self._section = _Section(self._section.headings)
+
+
+def iter_segments(extractor: _TextExtractor, path: str) -> Iterator[Segment]:
+    """
+    feed `path` to `extractor` and yield the blocks of every finished section
+    """
+
+    def segments() -> Iterator[Segment]:
+        for section in extractor.pop_sections():
+            for index, block in enumerate(section.blocks):
+                yield Segment(
+                    block,
+                    separator=BLOCK_SEPARATOR,
+                    boundary=index == 0,
+                    headings=tuple(section.headings),
+                )
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while block := f.read(READ_SIZE):
+            extractor.feed(block)
+            yield from segments()
+    extractor.close()
+    yield from segments()
+
+
+def load_html(path: str) -> List[Document]:
+    extractor = _TextExtractor()
+    chunks = []
+    for chunk in pack_segments(iter_segments(extractor, path), path):
+        # the title is read from `head` before the first block
+        chunk.metadata["title"] = extractor.title.strip()
+        chunks.append(chunk)
+    return chunks
@@ -5,7 +5,9 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
 from src.config import langchain_config
-from src.config import runtime_config
+from src.config import chunking_config, html_config, runtime_config, srt_config
+from src.rag.html import load_html
+from src.rag.srt import load_srt
 
 test_splitter = RecursiveCharacterTextSplitter(
     chunk_size=langchain_config.CHUNK_SIZE,
@@ -14,13 +16,37 @@ test_splitter = RecursiveCharacterTextSplitter(
 )
 
 
+def get_loader_fingerprint() -> str:
+    """
+    settings that change the chunks of a file, loaded files are reloaded when they change
+    """
+    srt = (
+        f"srt:{srt_config.PARAGRAPH_GAP}:{srt_config.MAX_SENTENCE_CHARS}"
+        if srt_config.NATIVE
+        else "srt:langchain"
+    )
+    html = "html:native" if html_config.NATIVE else "html:langchain"
+    return (
+        f"{srt}|{html}|chunk:{chunking_config.MAX_TOKENS}:{chunking_config.MIN_TOKENS}"
+        f":{chunking_config.OVERLAP_TOKENS}|split:{langchain_config.CHUNK_SIZE}"
+        f":{langchain_config.CHUNK_OVERLAP}:{langchain_config.ADD_START_INDEX}"
+    )
+
+
 def get_documents(path: str) -> List[Document]:
-    if path.endswith(".srt"):
-        loader = SRTLoader(path)
-    elif path.endswith(".html"):
-        loader = BSHTMLLoader(path)
-    document = loader.load()
-    chunks = test_splitter.split_documents(document)
+    # the native readers pack whole sentences and sections into chunks by tokens,
+    # the text splitter would cut them again
+    if path.endswith(".srt") and srt_config.NATIVE:
+        chunks = load_srt(path)
+    elif path.endswith(".html") and html_config.NATIVE:
+        chunks = load_html(path)
+    else:
+        if path.endswith(".srt"):
+            loader = SRTLoader(path)
+        elif path.endswith(".html"):
+            loader = BSHTMLLoader(path)
+        document = loader.load()
+        chunks = test_splitter.split_documents(document)
 
     if runtime_config.VERBOSE:
         print(f"Splitting {path} into {len(chunks)} chunks")
@@ -0,0 +1,141 @@
+"""
+per-collection manifest of loaded source files, used by incremental `load`
+- kept per storage backend, a collection loaded into Chroma is not loaded into NumPy
+"""
+
+import hashlib
+import os
+import uuid
+
+from pydantic import BaseModel, Field
+
+from src.config import cache_config, runtime_config
+from src.log import get_logger
+
+
+class ManifestEntry(BaseModel):
+    sha256: str
+    size: int
+    mtime: float
+    chunk_ids: list[str] = Field(default_factory=list)
+    # added to every chunk of the file, e.g. its week, a renamed week reloads the file
+    metadata: dict[str, str] = Field(default_factory=dict)
+
+
+class CollectionManifest(BaseModel):
+    collection_name: str
+    # changes whenever the content of the collection changes
+    version: str = Field(default="")
+    # settings of the loader the files were chunked with
+    loader: str = Field(default="")
+    files: dict[str, ManifestEntry] = Field(default_factory=dict)
+
+    @staticmethod
+    def get_path(collection_name: str) -> str:
+        return f"{cache_config.FOLDER}/manifests/{runtime_config.STORAGE.value}/{collection_name}.json"
+
+    @classmethod
+    def load(cls, collection_name: str) -> "CollectionManifest":
+        path = cls.get_path(collection_name)
+        if not os.path.exists(path):
+            return cls(collection_name=collection_name)
+        with open(path, "r") as f:
+            return cls.model_validate_json(f.read())
+
+    def save(self):
+        path = self.get_path(self.collection_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first, so a crash never leaves a truncated manifest
+        with open(f"{path}.tmp", "w") as f:
+            f.write(self.model_dump_json())
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def delete(cls, collection_name: str):
+        path = cls.get_path(collection_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def bump_version(self):
+        self.version = uuid.uuid4().hex
+
+    def diff(
+        self, paths: list[str], metadata: dict[str, dict] | None = None
+    ) -> tuple[list[str], list[str]]:
+        """
+        :return: the new or changed paths, and the paths that no longer exist
+        """
+        metadata = metadata or {}
+        changed = []
+        for path in paths:
+            entry = self.files.get(path)
+            stat = os.stat(path)
+            if entry is None or entry.metadata != metadata.get(path, {}):
+                changed.append(path)
+                continue
+            # size and mtime are enough to skip hashing unchanged files
+            if entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+                continue
+            if entry.sha256 == file_sha256(path):
+                entry.size, entry.mtime = stat.st_size, stat.st_mtime
+                continue
+            changed.append(path)
+
+        current = set(paths)
+        removed = [path for path in self.files if path not in current]
+        get_logger().debug(
+            f"{self.collection_name}: {len(changed)} changed, {len(removed)} removed"
+        )
+        return changed, removed
+
+    def update(
+        self, path: str, chunk_ids: list[str], metadata: dict | None = None
+    ) -> list[str]:
+        """
+        record the chunks stored for `path` with `metadata`
+        :return: the chunk ids of the previous version which are no longer used
+        """
+        stat = os.stat(path)
+        previous = self.files.get(path)
+        self.files[path] = ManifestEntry(
+            sha256=file_sha256(path),
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            chunk_ids=chunk_ids,
+            metadata=metadata or {},
+        )
+        if previous is None:
+            return []
+        return sorted(set(previous.chunk_ids) - set(chunk_ids))
+
+    def invalidate(self, path: str):
+        """
+        the next incremental load reloads `path`, its chunks stay stored until then
+        """
+        entry = self.files.get(path)
+        if entry is not None:
+            entry.sha256, entry.size = "", -1
+
+    def remove(self, path: str) -> list[str]:
+        entry = self.files.pop(path, None)
+        return entry.chunk_ids if entry else []
+
+
+def get_collection_version(collection_name: str) -> str:
+    return CollectionManifest.load(collection_name).version
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_chunk_id(source: str, index: int, text: str) -> str:
+    """
+    deterministic id of the `index`-th chunk of `source`, so re-loading a file upserts
+    its chunks instead of duplicating them
+    """
+    return hashlib.sha256(f"{source}\0{index}\0{text}".encode()).hexdigest()[:32]
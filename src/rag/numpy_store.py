@@ -0,0 +1,260 @@
+"""
+embedded vector store backed by a memory-mapped `.npy` matrix per collection
+- `embeddings.npy`: float32 matrix of L2-normalized embeddings, one row per chunk
+- `records.json`: id, text and metadata of each row
+- search is an exact, vectorized cosine top-k over the whole matrix
+"""
+
+import json
+import os
+import shutil
+import threading
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.config import numpy_store_config
+from src.log import get_logger
+
+
+class NumpyVectorStore(VectorStore):
+    def __init__(
+        self,
+        collection_name: str,
+        embedding_function: Embeddings,
+        folder: str | None = None,
+    ) -> None:
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.path = f"{folder or numpy_store_config.FOLDER}/{collection_name}"
+        self._lock = threading.RLock()
+        self._matrix: np.ndarray | None = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._dirty = False
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    @property
+    def _matrix_path(self) -> str:
+        return f"{self.path}/embeddings.npy"
+
+    @property
+    def _records_path(self) -> str:
+        return f"{self.path}/records.json"
+
+    def _load(self):
+        if not os.path.exists(self._records_path):
+            return
+        # memory-mapped, rows are only paged in when searched
+        self._matrix = np.load(self._matrix_path, mmap_mode="r")
+        with open(self._records_path, "r") as f:
+            records = json.load(f)
+        self._ids = records["ids"]
+        self._texts = records["texts"]
+        self._metadatas = records["metadatas"]
+
+    def persist(self):
+        """
+        write pending changes to disk, replacing the previous files atomically
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            matrix = self._matrix
+            if matrix is None:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+            with open(f"{self._matrix_path}.tmp", "wb") as f:
+                np.save(f, matrix)
+            with open(f"{self._records_path}.tmp", "w") as f:
+                json.dump(
+                    {
+                        "ids": self._ids,
+                        "texts": self._texts,
+                        "metadatas": self._metadatas,
+                    },
+                    f,
+                )
+            os.replace(f"{self._matrix_path}.tmp", self._matrix_path)
+            os.replace(f"{self._records_path}.tmp", self._records_path)
+            self._dirty = False
+            get_logger().debug(
+                f"Persisted {len(self._ids)} vectors of {self.collection_name}"
+            )
+
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+    ):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        with self._lock:
+            positions = {id_: row for row, id_ in enumerate(self._ids)}
+            matrix = self._matrix
+            # copy a memory-mapped matrix into memory before the first write
+            if isinstance(matrix, np.memmap):
+                matrix = np.array(matrix)
+            if matrix is not None and not matrix.size:
+                matrix = None
+            new_rows = []
+            for index, id_ in enumerate(ids):
+                row = positions.get(id_)
+                if row is not None and matrix is not None:
+                    matrix[row] = vectors[index]
+                    self._texts[row] = texts[index]
+                    self._metadatas[row] = metadatas[index]
+                else:
+                    positions[id_] = len(self._ids)
+                    self._ids.append(id_)
+                    self._texts.append(texts[index])
+                    self._metadatas.append(metadatas[index])
+                    new_rows.append(index)
+            if new_rows:
+                appended = vectors[new_rows]
+                matrix = appended if matrix is None else np.vstack([matrix, appended])
+            self._matrix = matrix
+            self._dirty = True
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if ids is None:
+            ids = [
+                f"{self.collection_name}-{len(self._ids) + i}"
+                for i in range(len(texts))
+            ]
+        if metadatas is None:
+            metadatas = [{} for _ in texts]
+        self.upsert_embeddings(
+            ids, texts, self.embedding_function.embed_documents(texts), metadatas
+        )
+        self.persist()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return True
+        stale = set(ids)
+        with self._lock:
+            keep = [row for row, id_ in enumerate(self._ids) if id_ not in stale]
+            if len(keep) == len(self._ids):
+                return True
+            self._matrix = np.array(self._matrix[keep]) if keep else None
+            self._ids = [self._ids[row] for row in keep]
+            self._texts = [self._texts[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._dirty = True
+        self.persist()
+        return True
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4
+    ) -> List[tuple[Document, float]]:
+        with self._lock:
+            matrix, ids = self._matrix, self._ids
+            texts, metadatas = self._texts, self._metadatas
+        if matrix is None or not len(ids):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        scores = matrix @ query
+        k = min(k, len(scores))
+        # partial sort, only the top-k rows are fully ordered
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (
+                Document(id=ids[row], page_content=texts[row], metadata=metadatas[row]),
+                float(scores[row]),
+            )
+            for row in top
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(embedding, k)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding_function.embed_query(query), k
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return self.similarity_search_by_vector(
+            self.embedding_function.embed_query(query), k
+        )
+
+    def _select_relevance_score_fn(self):
+        # cosine similarity is already in [-1, 1]
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        collection_name: str = "default",
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(collection_name=collection_name, embedding_function=embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+_stores: dict[str, NumpyVectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_numpy_store(
+    collection_name: str, embeddings: Embeddings | None
+) -> NumpyVectorStore:
+    """
+    one store per collection and process, so concurrent writers share the same matrix
+    """
+    with _stores_lock:
+        store = _stores.get(collection_name)
+        if store is None:
+            store = NumpyVectorStore(collection_name, embeddings)
+            _stores[collection_name] = store
+        if embeddings is not None:
+            store.embedding_function = embeddings
+        return store
+
+
+def numpy_collection_exists(collection_name: str) -> bool:
+    return os.path.exists(f"{numpy_store_config.FOLDER}/{collection_name}")
+
+
+def delete_numpy_collection(collection_name: str):
+    with _stores_lock:
+        _stores.pop(collection_name, None)
+    shutil.rmtree(f"{numpy_store_config.FOLDER}/{collection_name}", ignore_errors=True)
@@ -0,0 +1,242 @@
+"""
+staged ingestion pipeline for `load`
+1. load and split files in a process pool, near-duplicate chunks are skipped
+2. merge chunks of many files into full-size embedding batches
+3. embed the batches concurrently
+4. write the embedded batches to the vector database concurrently
+
+every stage is connected by a bounded queue, so a slow stage applies backpressure
+instead of buffering the whole course in memory
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.config import ingest_config, runtime_config
+from src.log import get_logger, rich_print
+from src.rag.dedup import DedupIndex, get_signatures
+from src.rag.loader import get_documents
+from src.rag.manifest import get_chunk_id
+from src.rag.vector_database import add_embeddings, flush_embeddings
+from src.tracing import count, span
+
+# sentinel to tell the next stage that the previous one is done
+_DONE = None
+
+
+@dataclass
+class IngestStats:
+    files: int = 0
+    chunks: int = 0
+    batches: int = 0
+    failed_files: List[str] = field(default_factory=list)
+    failed_chunks: int = 0
+    duplicate_chunks: int = 0
+    # chunk ids of each parsed file, in chunk order
+    file_chunk_ids: dict[str, List[str]] = field(default_factory=dict)
+
+    def stored_files(self) -> dict[str, List[str]]:
+        """
+        files whose chunks were all embedded and stored
+        """
+        failed = set(self.failed_files)
+        return {
+            path: chunk_ids
+            for path, chunk_ids in self.file_chunk_ids.items()
+            if path not in failed
+        }
+
+    def fail_documents(self, documents: List[Document]):
+        self.failed_chunks += len(documents)
+        failed = set(self.failed_files)
+        for document in documents:
+            source = document.metadata.get("source")
+            if source and source not in failed:
+                failed.add(source)
+                self.failed_files.append(source)
+
+
+def _load_file(
+    path: str, fingerprint: bool
+) -> tuple[List[Document], np.ndarray | None]:
+    """
+    load and split `path`, with the MinHash signatures of its chunks when `fingerprint`
+    """
+    documents = get_documents(path)
+    if not fingerprint:
+        return documents, None
+    return documents, get_signatures([document.page_content for document in documents])
+
+
+@dataclass
+class _Batch:
+    documents: List[Document]
+    embeddings: List[List[float]] | None = None
+
+
+async def _parse_stage(
+    paths: List[str],
+    root: str,
+    metadata: dict[str, dict],
+    dedup: DedupIndex | None,
+    executor: ProcessPoolExecutor,
+    chunk_queue: asyncio.Queue,
+    stats: IngestStats,
+):
+    loop = asyncio.get_running_loop()
+    # keep a bounded number of files in flight, so parsed chunks wait in the queue
+    # instead of piling up in finished futures
+    limit = asyncio.Semaphore(ingest_config.PARSE_WORKERS * 2)
+
+    async def parse(path: str):
+        async with limit:
+            try:
+                with span("parse", "ingest", path=path) as current:
+                    documents, signatures = await loop.run_in_executor(
+                        executor, _load_file, path, dedup is not None
+                    )
+                    current.set(chunks=len(documents))
+            except Exception as e:
+                rich_print(f"[red]Error loading [bold]{path}[/bold]: {e}[/red]")
+                stats.failed_files.append(path)
+                return
+            if runtime_config.VERBOSE:
+                rich_print(
+                    f"Loaded [bold]{path.split('/')[-1]}[/bold] into {len(documents)} chunks"
+                )
+            else:
+                rich_print(f"Processing [bold]{path.split('/')[-1]}[/bold]")
+            source = os.path.relpath(path, root)
+            file_metadata = metadata.get(path, {})
+            for index, document in enumerate(documents):
+                document.metadata.update(file_metadata)
+                document.metadata["source"] = path
+                document.id = get_chunk_id(source, index, document.page_content)
+            if dedup is not None:
+                kept = dedup.filter(path, documents, signatures)
+                stats.duplicate_chunks += len(documents) - len(kept)
+                count("duplicate_chunks", len(documents) - len(kept))
+                documents = kept
+            stats.file_chunk_ids[path] = [document.id for document in documents]
+            stats.files += 1
+            await chunk_queue.put(documents)
+
+    await asyncio.gather(*(parse(path) for path in paths))
+    await chunk_queue.put(_DONE)
+
+
+async def _batch_stage(
+    chunk_queue: asyncio.Queue, batch_queue: asyncio.Queue, workers: int
+):
+    batch_size = ingest_config.EMBEDDING_BATCH_SIZE
+    pending: List[Document] = []
+    while (documents := await chunk_queue.get()) is not _DONE:
+        pending.extend(documents)
+        while len(pending) >= batch_size:
+            await batch_queue.put(_Batch(documents=pending[:batch_size]))
+            pending = pending[batch_size:]
+    if pending:
+        await batch_queue.put(_Batch(documents=pending))
+    for _ in range(workers):
+        await batch_queue.put(_DONE)
+
+
+async def _embed_stage(
+    embeddings: Embeddings,
+    batch_queue: asyncio.Queue,
+    write_queue: asyncio.Queue,
+    stats: IngestStats,
+):
+    while (batch := await batch_queue.get()) is not _DONE:
+        texts = [document.page_content for document in batch.documents]
+        try:
+            with span("embed_batch", "ingest", chunks=len(texts)):
+                batch.embeddings = await embeddings.aembed_documents(texts)
+        except Exception as e:
+            rich_print(f"[red]Error embedding {len(texts)} chunks: {e}[/red]")
+            stats.fail_documents(batch.documents)
+            continue
+        await write_queue.put(batch)
+
+
+async def _write_stage(
+    collection_name: str, write_queue: asyncio.Queue, stats: IngestStats
+):
+    while (batch := await write_queue.get()) is not _DONE:
+        try:
+            with span("write_batch", "ingest", chunks=len(batch.documents)):
+                await asyncio.to_thread(
+                    add_embeddings,
+                    collection_name=collection_name,
+                    ids=[document.id for document in batch.documents],
+                    texts=[document.page_content for document in batch.documents],
+                    embeddings=batch.embeddings,
+                    metadatas=[document.metadata for document in batch.documents],
+                )
+        except Exception as e:
+            rich_print(f"[red]Error adding documents to collection {collection_name}")
+            rich_print(e)
+            stats.fail_documents(batch.documents)
+            continue
+        stats.chunks += len(batch.documents)
+        stats.batches += 1
+        get_logger().debug(
+            f"Stored batch of {len(batch.documents)} chunks in {collection_name}"
+        )
+
+
+async def ingest_files(
+    collection_name: str,
+    paths: List[str],
+    embeddings: Embeddings,
+    root: str,
+    metadata: dict[str, dict] | None = None,
+    dedup: DedupIndex | None = None,
+) -> IngestStats:
+    """
+    load, split, embed and store `paths` into `collection_name`
+    - chunk ids are derived from the path relative to `root`, the chunk index and text
+    - `metadata` of a path, e.g. its week, is added to every chunk of the path
+    - chunks found in `dedup` are skipped, the others are added to it
+    """
+    stats = IngestStats()
+    queue_size = ingest_config.QUEUE_SIZE
+    chunk_queue = asyncio.Queue(maxsize=queue_size)
+    batch_queue = asyncio.Queue(maxsize=queue_size)
+    write_queue = asyncio.Queue(maxsize=queue_size)
+    embed_workers = max(1, ingest_config.EMBED_CONCURRENCY)
+    write_workers = max(1, ingest_config.WRITE_CONCURRENCY)
+
+    async def embed_then_close():
+        await asyncio.gather(
+            *(
+                _embed_stage(embeddings, batch_queue, write_queue, stats)
+                for _ in range(embed_workers)
+            )
+        )
+        for _ in range(write_workers):
+            await write_queue.put(_DONE)
+
+    with ProcessPoolExecutor(max_workers=ingest_config.PARSE_WORKERS) as executor:
+        await asyncio.gather(
+            _parse_stage(
+                paths, root, metadata or {}, dedup, executor, chunk_queue, stats
+            ),
+            _batch_stage(chunk_queue, batch_queue, embed_workers),
+            embed_then_close(),
+            *(
+                _write_stage(collection_name, write_queue, stats)
+                for _ in range(write_workers)
+            ),
+        )
+    with span("flush", "ingest"):
+        await asyncio.to_thread(flush_embeddings, collection_name)
+
+    return stats
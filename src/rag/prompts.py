@@ -1,39 +1,54 @@
-from langchain import hub
-from langchain_core.prompts import PromptTemplate
+"""
+prompt templates, read from `coursera_config.PROMPTS_FOLDER` on first use
+"""
+
+import os
+from functools import cache
+
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 
 from src.config import coursera_config
+from src.log import get_logger
 
+# prompts added after a prompts folder was set up are read from the examples
+EXAMPLE_PROMPTS_FOLDER = os.path.join(
+    os.path.dirname(__file__), "..", "..", "example_prompts"
+)
 
-def _get_prompt_template(prompt_name: str) -> str:
-    return open(f"{coursera_config.PROMPTS_FOLDER}/{prompt_name}.txt").read()
+# vendored copy of the `rlm/rag-prompt` hub prompt, so no network access is needed
+RAG_PROMPT_TEMPLATE = """You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+Question: {question}
+Context: {context}
+Answer:"""
 
+RAG_WITHOUT_QUESTION_PROMPT_TEMPLATE = """
+You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+Context: {context}
+Answer:
+"""
 
-course_toc_template = _get_prompt_template("course_toc_prompt")
-course_toc_prompt = PromptTemplate.from_template(course_toc_template)
 
-week_toc_template = _get_prompt_template("week_toc_prompt")
-week_toc_prompt = PromptTemplate.from_template(week_toc_template)
+@cache
+def get_prompt_template(prompt_name: str) -> str:
+    path = f"{coursera_config.PROMPTS_FOLDER}/{prompt_name}.txt"
+    example_path = f"{EXAMPLE_PROMPTS_FOLDER}/{prompt_name}.txt"
+    if not os.path.exists(path) and os.path.exists(example_path):
+        get_logger().debug(f"{path} not found, using {example_path}")
+        path = example_path
+    with open(path) as f:
+        return f.read()
 
-week_item_toc_template = _get_prompt_template("week_item_toc_prompt")
-week_item_toc_prompt = PromptTemplate.from_template(week_item_toc_template)
 
-is_concept_or_project_template = _get_prompt_template("is_concept_or_project_prompt")
-is_concept_or_project_prompt = PromptTemplate.from_template(
-    is_concept_or_project_template
-)
+@cache
+def get_prompt(prompt_name: str) -> PromptTemplate:
+    return PromptTemplate.from_template(get_prompt_template(prompt_name))
 
-concept_slide_template = _get_prompt_template("concept_slide_prompt")
-concept_slide_prompt = PromptTemplate.from_template(concept_slide_template)
 
-project_slide_template = _get_prompt_template("project_slide_prompt")
-project_slide_prompt = PromptTemplate.from_template(project_slide_template)
+@cache
+def get_rag_prompt() -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages([("human", RAG_PROMPT_TEMPLATE)])
 
-rag_prompt = hub.pull("rlm/rag-prompt")
 
-rag_without_question_prompt = PromptTemplate.from_template(
-    """
-You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
-Context: {context} 
-Answer:
-"""
-)
+@cache
+def get_rag_without_question_prompt() -> PromptTemplate:
+    return PromptTemplate.from_template(RAG_WITHOUT_QUESTION_PROMPT_TEMPLATE)
@@ -0,0 +1,490 @@
+"""
+process-wide scheduler of model calls
+- at most `limit` calls are in flight across all courses of the process
+- free slots are handed to the waiting courses in turn, so one course cannot starve the others
+- requests and tokens per minute are drawn from token buckets, sized from the config or
+  from the rate limit headers of the responses
+- `limit` halves on a rate limited response and grows by one after `limit` successes
+- rate limited and transient failures are retried with jittered exponential backoff
+- the course of a call is taken from `course_scope`, set by the batch runner
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Mapping
+
+from src.config import runtime_config, scheduler_config
+from src.log import get_logger
+
+DEFAULT_COURSE = "default"
+
+_course: ContextVar[str] = ContextVar("course", default=DEFAULT_COURSE)
+
+# status codes worth another attempt, the request itself was fine
+_RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+_RETRY_ERRORS = {"APIConnectionError", "APITimeoutError"}
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+@contextmanager
+def course_scope(course_name: str):
+    """
+    account the model calls made inside this block to `course_name`
+    """
+    token = _course.set(course_name)
+    try:
+        yield
+    finally:
+        _course.reset(token)
+
+
+def get_current_course() -> str:
+    return _course.get()
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """
+    parse the durations of rate limit headers, e.g. `20ms`, `1s` or `6m0s`
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _get_header(headers: Mapping[str, str], name: str) -> str | None:
+    value = headers.get(name)
+    if value is None:
+        value = headers.get(name.title())
+    return value
+
+
+def _get_error_headers(error: Exception) -> Mapping[str, str]:
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def is_retryable(error: Exception) -> bool:
+    if getattr(error, "status_code", None) in _RETRY_STATUS_CODES:
+        return True
+    return any(cls.__name__ in _RETRY_ERRORS for cls in type(error).__mro__)
+
+
+@dataclass
+class CourseCallStats:
+    calls: int = 0
+    failures: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    waited: float = 0.0
+    elapsed: float = 0.0
+
+
+class TokenBucket:
+    """
+    `capacity` units per minute, refilled continuously
+    - a reservation may overdraw the bucket, later reservations wait until it is paid back
+    """
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(
+            self.capacity, self.level + (now - self._updated) * self.capacity / 60
+        )
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        :return: seconds to wait before the reserved amount may be used
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level * 60 / self.capacity
+
+    def adjust(self, amount: float):
+        """
+        pay back (negative) or charge more (positive) than reserved, once the usage is known
+        """
+        self.level = min(self.capacity, self.level - amount)
+
+    def sync(self, capacity: float | None, remaining: float | None):
+        """
+        follow the limit and the remaining budget reported by the server
+        """
+        self._refill(time.monotonic())
+        if capacity:
+            self.capacity = capacity
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+
+
+class _Waiter:
+    """
+    a thread blocked on an event, or a coroutine awaiting a future of its own loop
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self.loop = loop
+        self.granted = False
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Slot:
+    """
+    handle of a granted call, reports the outcome back to the scheduler
+    """
+
+    def __init__(self, scheduler: "FairScheduler", tokens: int) -> None:
+        self.scheduler = scheduler
+        self.tokens = tokens
+
+    def observe(
+        self, headers: Mapping[str, str] | None = None, tokens: int | None = None
+    ):
+        """
+        :param headers: rate limit headers of the response
+        :param tokens: tokens actually used, to correct the estimate reserved for the call
+        """
+        self.scheduler._observe(self, headers, tokens)
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.stats: dict[str, CourseCallStats] = {}
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        # courses with waiters, in the order they are served
+        self._turns: deque[str] = deque()
+        self._waiters: dict[str, deque[_Waiter]] = {}
+        self._lock = threading.Lock()
+
+    def _course_stats(self, course: str) -> CourseCallStats:
+        return self.stats.setdefault(course, CourseCallStats())
+
+    # slots
+    def _enqueue(self, course: str, waiter: _Waiter) -> bool:
+        """
+        :return: True if the slot is granted right away
+        """
+        with self._lock:
+            if self._in_flight < self.limit and not self._turns:
+                self._in_flight += 1
+                waiter.granted = True
+                return True
+            if course not in self._waiters or not self._waiters[course]:
+                self._waiters[course] = deque()
+                self._turns.append(course)
+            self._waiters[course].append(waiter)
+            return False
+
+    def _cancel(self, course: str, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted:
+                self._release_locked()
+                return
+            self._waiters[course].remove(waiter)
+            if not self._waiters[course]:
+                self._turns.remove(course)
+
+    def _release_locked(self):
+        self._in_flight -= 1
+        while self._turns and self._in_flight < self.limit:
+            course = self._turns.popleft()
+            waiter = self._waiters[course].popleft()
+            if self._waiters[course]:
+                self._turns.append(course)
+            self._in_flight += 1
+            waiter.wake()
+
+    def _release(self):
+        with self._lock:
+            self._release_locked()
+
+    def _reserve_budget(self, tokens: int) -> float:
+        """
+        :return: seconds to wait, so the call stays within the pause and the budgets
+        """
+        with self._lock:
+            delay = max(0.0, self._paused_until - time.monotonic())
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1))
+            if self.tokens is not None and tokens:
+                delay = max(delay, self.tokens.reserve(tokens))
+            return delay
+
+    @contextmanager
+    def slot(self, tokens: int = 0) -> Iterator[Slot]:
+        course = get_current_course()
+        start = time.perf_counter()
+        waiter = _Waiter()
+        if not self._enqueue(course, waiter):
+            waiter.event.wait()
+        try:
+            time.sleep(self._reserve_budget(tokens))
+            waited = time.perf_counter() - start
+            try:
+                yield Slot(self, tokens)
+            finally:
+                self._record_time(course, waited, time.perf_counter() - start - waited)
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0) -> AsyncIterator[Slot]:
+        course = get_current_course()
+        start = time.perf_counter()
+        waiter = _Waiter(asyncio.get_running_loop())
+        if not self._enqueue(course, waiter):
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._cancel(course, waiter)
+                raise
+        try:
+            await asyncio.sleep(self._reserve_budget(tokens))
+            waited = time.perf_counter() - start
+            try:
+                yield Slot(self, tokens)
+            finally:
+                self._record_time(course, waited, time.perf_counter() - start - waited)
+        finally:
+            self._release()
+
+    # feedback
+    def _record_time(self, course: str, waited: float, elapsed: float):
+        with self._lock:
+            stats = self._course_stats(course)
+            stats.waited += waited
+            stats.elapsed += elapsed
+
+    def _observe(
+        self, slot: Slot, headers: Mapping[str, str] | None, tokens: int | None
+    ):
+        with self._lock:
+            if tokens is not None and self.tokens is not None:
+                self.tokens.adjust(tokens - slot.tokens)
+            if headers:
+                self._sync_headers(headers)
+
+    def _sync_headers(self, headers: Mapping[str, str]):
+        for kind in ("requests", "tokens"):
+            limit = _get_header(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _get_header(headers, f"x-ratelimit-remaining-{kind}")
+            if limit is None and remaining is None:
+                continue
+            try:
+                limit = float(limit) if limit is not None else None
+                remaining = float(remaining) if remaining is not None else None
+            except ValueError:
+                continue
+            bucket = getattr(self, kind)
+            if bucket is None and limit:
+                # no budget configured, follow the one of the account
+                bucket = TokenBucket(limit)
+                setattr(self, kind, bucket)
+            if bucket is not None:
+                bucket.sync(limit, remaining)
+
+    def _retry_after(self, error: Exception) -> float | None:
+        headers = _get_error_headers(error)
+        seconds = _parse_duration(_get_header(headers, "retry-after-ms"))
+        if seconds is not None:
+            seconds /= 1000
+        for name in (
+            "retry-after",
+            "x-ratelimit-reset-requests",
+            "x-ratelimit-reset-tokens",
+        ):
+            if seconds is None:
+                seconds = _parse_duration(_get_header(headers, name))
+        if seconds is None:
+            return None
+        # e.g. a daily quota, waiting for its reset is not worth it
+        return min(seconds, scheduler_config.BACKOFF_MAX)
+
+    def _backoff(self, course: str, error: Exception, attempt: int) -> float:
+        """
+        :return: seconds to wait before the next attempt
+        """
+        # full jitter, retries of concurrent calls do not arrive at the same time
+        delay = random.uniform(
+            0,
+            min(
+                scheduler_config.BACKOFF_MAX,
+                scheduler_config.BACKOFF_BASE * 2**attempt,
+            ),
+        )
+        retry_after = self._retry_after(error)
+        with self._lock:
+            stats = self._course_stats(course)
+            stats.retries += 1
+            if is_rate_limited(error):
+                stats.rate_limited += 1
+                # multiplicative decrease, and hold every new call until the budget is back
+                self.limit = max(scheduler_config.MIN_CONCURRENCY, self.limit // 2)
+                self._successes = 0
+                if retry_after is not None:
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + retry_after
+                    )
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        get_logger().debug(
+            f"Retrying {type(error).__name__} of {course} in {delay:.1f}s, "
+            f"attempt {attempt + 1}, {self.limit} calls in flight"
+        )
+        return delay
+
+    def _finish(self, course: str, failed: bool):
+        with self._lock:
+            stats = self._course_stats(course)
+            stats.calls += 1
+            stats.failures += failed
+            if failed:
+                return
+            # additive increase, one more slot after a full round of successes
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+                # the new slot goes to the next waiter right away
+                self._in_flight += 1
+                self._release_locked()
+
+    # calls
+    def call(self, fn: Callable[[Slot], Any], tokens: int = 0) -> Any:
+        """
+        run `fn` in a slot, retried on rate limits and transient failures
+        """
+        course = get_current_course()
+        for attempt in range(scheduler_config.MAX_RETRIES + 1):
+            try:
+                with self.slot(tokens) as slot:
+                    result = fn(slot)
+                self._finish(course, failed=False)
+                return result
+            except Exception as e:
+                if attempt == scheduler_config.MAX_RETRIES or not is_retryable(e):
+                    self._finish(course, failed=True)
+                    raise
+                time.sleep(self._backoff(course, e, attempt))
+
+    async def acall(self, fn: Callable[[Slot], Awaitable[Any]], tokens: int = 0) -> Any:
+        course = get_current_course()
+        for attempt in range(scheduler_config.MAX_RETRIES + 1):
+            try:
+                async with self.aslot(tokens) as slot:
+                    result = await fn(slot)
+                self._finish(course, failed=False)
+                return result
+            except Exception as e:
+                if attempt == scheduler_config.MAX_RETRIES or not is_retryable(e):
+                    self._finish(course, failed=True)
+                    raise
+                await asyncio.sleep(self._backoff(course, e, attempt))
+
+    def iterate(self, fn: Callable[[Slot], Iterator], tokens: int = 0) -> Iterator:
+        """
+        like `call` for a stream, a stream is only retried before its first item
+        """
+        course = get_current_course()
+        for attempt in range(scheduler_config.MAX_RETRIES + 1):
+            started = False
+            try:
+                with self.slot(tokens) as slot:
+                    for item in fn(slot):
+                        started = True
+                        yield item
+                self._finish(course, failed=False)
+                return
+            except Exception as e:
+                if (
+                    started
+                    or attempt == scheduler_config.MAX_RETRIES
+                    or not is_retryable(e)
+                ):
+                    self._finish(course, failed=True)
+                    raise
+                time.sleep(self._backoff(course, e, attempt))
+
+    async def aiterate(
+        self, fn: Callable[[Slot], AsyncIterator], tokens: int = 0
+    ) -> AsyncIterator:
+        course = get_current_course()
+        for attempt in range(scheduler_config.MAX_RETRIES + 1):
+            started = False
+            try:
+                async with self.aslot(tokens) as slot:
+                    async for item in fn(slot):
+                        started = True
+                        yield item
+                self._finish(course, failed=False)
+                return
+            except Exception as e:
+                if (
+                    started
+                    or attempt == scheduler_config.MAX_RETRIES
+                    or not is_retryable(e)
+                ):
+                    self._finish(course, failed=True)
+                    raise
+                await asyncio.sleep(self._backoff(course, e, attempt))
+
+
+@cache
+def get_scheduler() -> FairScheduler:
+    return FairScheduler(
+        max_concurrency=runtime_config.MAX_CONCURRENCY,
+        requests_per_minute=scheduler_config.REQUESTS_PER_MINUTE,
+        tokens_per_minute=scheduler_config.TOKENS_PER_MINUTE,
+    )
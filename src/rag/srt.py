@@ -0,0 +1,119 @@
+"""
+streaming reader of `.srt` subtitles into paragraph text chunks
+- indices, timestamps and formatting tags are dropped
+- cues are merged into sentences, a pause longer than `srt_config.PARAGRAPH_GAP`
+  seconds starts a new paragraph
+- sentences are packed into chunks by `pack_segments`, every chunk keeps the time
+  range of its cues as `start_time` and `end_time` seconds
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterator, List
+
+from langchain_core.documents import Document
+
+from src.config import srt_config
+from src.rag.chunking import SENTENCE_END_PATTERN, Segment, pack_segments
+
+_TIMING_PATTERN = re.compile(
+    r"(\d+):(\d{2}):(\d{2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{1,3})"
+)
+# `<i>`, `<font color=...>` and `{\an8}` style tags
+_TAG_PATTERN = re.compile(r"<[^>]*>|\{\\[^}]*\}")
+
+
+@dataclass
+class Cue:
+    start: float
+    end: float
+    text: str
+
+
+def _to_seconds(hours: str, minutes: str, seconds: str, millis: str) -> float:
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def iter_cues(path: str) -> Iterator[Cue]:
+    """
+    parse the cues of an `.srt` file line by line, malformed blocks are skipped
+    """
+    timing = None
+    lines: List[str] = []
+    # `utf-8-sig` drops the byte order mark some editors write
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            match = _TIMING_PATTERN.match(line) if "-->" in line else None
+            if match is not None:
+                # a block without the blank line separator, its last line is the index
+                if lines and lines[-1].isdigit():
+                    lines.pop()
+                if timing is not None and lines:
+                    yield Cue(*timing, " ".join(lines))
+                groups = match.groups()
+                timing = (_to_seconds(*groups[:4]), _to_seconds(*groups[4:]))
+                lines = []
+            elif not line:
+                if timing is not None and lines:
+                    yield Cue(*timing, " ".join(lines))
+                timing = None
+                lines = []
+            elif timing is not None:
+                text = _TAG_PATTERN.sub("", line).strip()
+                if text:
+                    lines.append(text)
+    if timing is not None and lines:
+        yield Cue(*timing, " ".join(lines))
+
+
+def iter_segments(path: str) -> Iterator[Segment]:
+    """
+    merge the cue fragments of `path` into sentences, a sentence ends at a cue
+    boundary anyway once it is longer than `srt_config.MAX_SENTENCE_CHARS`,
+    e.g. in captions without punctuation
+    """
+    current: Segment | None = None
+    paragraph = True
+    previous_end = None
+    for cue in iter_cues(path):
+        if (
+            previous_end is not None
+            and cue.start - previous_end > srt_config.PARAGRAPH_GAP
+        ):
+            if current is not None:
+                yield current
+                current = None
+            paragraph = True
+        previous_end = cue.end
+
+        parts = SENTENCE_END_PATTERN.split(cue.text)
+        for index, part in enumerate(parts):
+            part = part.strip()
+            if not part:
+                continue
+            if current is None:
+                current = Segment(
+                    part,
+                    separator="\n\n" if paragraph else " ",
+                    boundary=paragraph,
+                    start_time=cue.start,
+                    end_time=cue.end,
+                )
+                paragraph = False
+            else:
+                current.text = f"{current.text} {part}"
+                current.end_time = cue.end
+            # every part but the last one ends with a sentence end
+            if index < len(parts) - 1 or part.endswith((".", "!", "?", "…")):
+                yield current
+                current = None
+        if current is not None and len(current.text) >= srt_config.MAX_SENTENCE_CHARS:
+            yield current
+            current = None
+    if current is not None:
+        yield current
+
+
+def load_srt(path: str) -> List[Document]:
+    return list(pack_segments(iter_segments(path), path))
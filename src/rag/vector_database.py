@@ -1,54 +1,129 @@
 """
 reference:
 https://python.langchain.com/v0.2/docs/integrations/vectorstores/chroma/
+
+the Chroma client, its collection handles and LangChain wrappers are process-wide,
+so every call reuses the same keep-alive HTTP connection pool
 """
 
+import threading
 from typing import List
 
 from langchain_chroma import Chroma
 import chromadb
 
 from chromadb.api import ClientAPI
+from chromadb.api.models.Collection import Collection
+from chromadb.config import Settings
 from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
 
-from ..config import chroma_config
+from ..config import chroma_config, runtime_config
+from src.enums import StorageEnum
 from src.log import rich_print, get_logger
-
-
-def get_chroma_client():
-    return chromadb.HttpClient(
-        host=chroma_config.HOST,
-        port=chroma_config.PORT,
-    )
-
-
-def create_collection(collection_name: str, chroma_client: ClientAPI | None):
-    if not chroma_client:
-        chroma_client = get_chroma_client()
-    _ = chroma_client.get_or_create_collection(collection_name)
+from src.rag.numpy_store import (
+    delete_numpy_collection,
+    get_numpy_store,
+    numpy_collection_exists,
+)
+
+
+# registry of the shared client, guarded by `_registry_lock`
+_registry_lock = threading.Lock()
+_chroma_client: ClientAPI | None = None
+_collections: dict[str, Collection] = {}
+_langchain_chromas: dict[tuple[str, int], Chroma] = {}
+
+
+def get_chroma_client() -> ClientAPI:
+    """
+    the process-wide Chroma client, created on first use
+    """
+    global _chroma_client
+    with _registry_lock:
+        if _chroma_client is None:
+            _chroma_client = chromadb.HttpClient(
+                host=chroma_config.HOST,
+                port=chroma_config.PORT,
+                settings=Settings(
+                    chroma_http_keepalive_secs=chroma_config.KEEPALIVE_SECS,
+                    chroma_http_max_connections=chroma_config.MAX_CONNECTIONS,
+                    chroma_http_max_keepalive_connections=chroma_config.MAX_CONNECTIONS,
+                ),
+            )
+        return _chroma_client
+
+
+def close_chroma_client():
+    """
+    release the shared client and every cached handle, the next call creates a new client
+    """
+    global _chroma_client
+    with _registry_lock:
+        client, _chroma_client = _chroma_client, None
+        _collections.clear()
+        _langchain_chromas.clear()
+    if client is not None:
+        client.close()
+
+
+def get_collection(
+    collection_name: str, chroma_client: ClientAPI | None = None
+) -> Collection:
+    """
+    the collection handle, created if it does not exist and cached for the shared client
+    """
+    if chroma_client:
+        return chroma_client.get_or_create_collection(collection_name)
+    collection = _collections.get(collection_name)
+    if collection is None:
+        collection = get_chroma_client().get_or_create_collection(collection_name)
+        with _registry_lock:
+            collection = _collections.setdefault(collection_name, collection)
+    return collection
+
+
+def _forget_collection(collection_name: str):
+    with _registry_lock:
+        _collections.pop(collection_name, None)
+        for key in [key for key in _langchain_chromas if key[0] == collection_name]:
+            del _langchain_chromas[key]
+
+
+def create_collection(collection_name: str, chroma_client: ClientAPI | None = None):
+    _ = get_collection(collection_name, chroma_client)
     return
 
 
-def check_collection(collection_name: str, chroma_client: ClientAPI | None):
+def check_collection(collection_name: str, chroma_client: ClientAPI | None = None):
     if not chroma_client:
         chroma_client = get_chroma_client()
     return collection_name in chroma_client.list_collections()
 
 
-def delete_collection(collection_name: str, chroma_client: ClientAPI | None):
-    if not chroma_client:
-        chroma_client = get_chroma_client()
+def delete_collection(
+    collection_name: str, chroma_client: ClientAPI | None = None
+) -> bool:
+    """
+    :return: whether the collection was deleted
+    """
     # check if collection exists
     logger = get_logger()
     logger.debug(f"Checking if collection {collection_name} exists")
-    logger.debug(chroma_client.list_collections())
-    exist = collection_name in chroma_client.list_collections()
+    if runtime_config.STORAGE == StorageEnum.NUMPY:
+        exist = numpy_collection_exists(collection_name)
+    else:
+        # the numpy store needs no Chroma server
+        if not chroma_client:
+            chroma_client = get_chroma_client()
+        logger.debug(chroma_client.list_collections())
+        exist = collection_name in chroma_client.list_collections()
     if not exist:
         rich_print(
             f"[bold][red]ERROR[/red][/bold] Collection [bold]{collection_name}[/bold] does not exist."
         )
-        return
+        return False
 
     # delete the collection
     rich_print(
@@ -57,34 +132,64 @@ def delete_collection(collection_name: str, chroma_client: ClientAPI | None):
     user_check = input()
     if user_check != "y":
         rich_print("Aborted.")
-        return
+        return False
+    if runtime_config.STORAGE == StorageEnum.NUMPY:
+        delete_numpy_collection(collection_name)
+        rich_print(f"Collection [bold]{collection_name}[/bold] deleted.")
+        return True
     chroma_client.delete_collection(collection_name)
+    _forget_collection(collection_name)
     rich_print(f"Collection [bold]{collection_name}[/bold] deleted.")
 
     logger.debug("Checking reamining collections")
     logger.debug(chroma_client.list_collections())
+    return True
 
 
 def get_langchain_chroma(
-    collection_name: str, embeddings: Embeddings, chroma_client: ClientAPI | None
+    collection_name: str,
+    embeddings: Embeddings,
+    chroma_client: ClientAPI | None = None,
 ):
-    if not chroma_client:
-        chroma_client = get_chroma_client()
-    # create a collection if it does not exist
-    _ = create_collection(collection_name=collection_name, chroma_client=chroma_client)
+    if chroma_client:
+        _ = create_collection(
+            collection_name=collection_name, chroma_client=chroma_client
+        )
+        return Chroma(
+            client=chroma_client,
+            collection_name=collection_name,
+            embedding_function=embeddings,
+        )
+
+    key = (collection_name, id(embeddings))
+    langchain_chroma = _langchain_chromas.get(key)
+    if langchain_chroma is None:
+        # create a collection if it does not exist
+        _ = create_collection(collection_name=collection_name)
+        langchain_chroma = Chroma(
+            client=get_chroma_client(),
+            collection_name=collection_name,
+            embedding_function=embeddings,
+        )
+        with _registry_lock:
+            langchain_chroma = _langchain_chromas.setdefault(key, langchain_chroma)
+    return langchain_chroma
 
-    return Chroma(
-        client=chroma_client,
-        collection_name=collection_name,
-        embedding_function=embeddings,
-    )
+
+def get_vector_store(collection_name: str, embeddings: Embeddings) -> VectorStore:
+    """
+    the LangChain vector store of `runtime_config.STORAGE`
+    """
+    if runtime_config.STORAGE == StorageEnum.NUMPY:
+        return get_numpy_store(collection_name, embeddings)
+    return get_langchain_chroma(collection_name=collection_name, embeddings=embeddings)
 
 
 def get_lanchain_chroma_from_document(
     collection_name: str,
     documents: List[Document],
     embeddings: Embeddings,
-    chroma_client: ClientAPI | None,
+    chroma_client: ClientAPI | None = None,
 ):
     if not chroma_client:
         chroma_client = get_chroma_client()
@@ -97,3 +202,50 @@ def get_lanchain_chroma_from_document(
         embedding_function=embeddings,
         client=chroma_client,
     )
+
+
+def add_embeddings(
+    collection_name: str,
+    ids: List[str],
+    texts: List[str],
+    embeddings: List[List[float]],
+    metadatas: List[dict],
+    chroma_client: ClientAPI | None = None,
+):
+    """
+    upsert already embedded chunks, in the same layout as `Chroma.add_documents`
+    """
+    if runtime_config.STORAGE == StorageEnum.NUMPY:
+        # the numpy store keeps its own embedding function, it is not used here
+        store = get_numpy_store(collection_name, embeddings=None)
+        store.upsert_embeddings(ids, texts, embeddings, metadatas)
+        return
+    collection = get_collection(collection_name, chroma_client)
+    collection.upsert(
+        ids=ids,
+        documents=texts,
+        embeddings=embeddings,
+        metadatas=metadatas,
+    )
+
+
+def delete_embeddings(
+    collection_name: str,
+    ids: List[str],
+    chroma_client: ClientAPI | None = None,
+):
+    if not ids:
+        return
+    if runtime_config.STORAGE == StorageEnum.NUMPY:
+        get_numpy_store(collection_name, embeddings=None).delete(ids)
+        return
+    collection = get_collection(collection_name, chroma_client)
+    collection.delete(ids=ids)
+
+
+def flush_embeddings(collection_name: str):
+    """
+    make the chunks written by `add_embeddings` durable
+    """
+    if runtime_config.STORAGE == StorageEnum.NUMPY:
+        get_numpy_store(collection_name, embeddings=None).persist()
@@ -0,0 +1,220 @@
+"""
+render the final markdown deck to PDF with marp
+- the deck is split into parts on the week markers written by the aggregator
+- parts are rendered by concurrent marp processes and merged into one PDF
+- rendered parts are kept by markdown hash, unchanged parts are not rendered again
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from rich.table import Table
+
+from src.aggregator import PART_MARKER
+from src.config import cache_config, render_config
+from src.log import get_logger, rich_print
+from src.tracing import bind_span, span
+
+_PART_PATTERN = re.compile(
+    "^" + re.escape(PART_MARKER).replace(re.escape("{name}"), "(.*?)") + "$",
+    re.MULTILINE,
+)
+_FRONT_MATTER_PATTERN = re.compile(r"\A---\n.*?\n---\n", re.DOTALL)
+
+
+@dataclass
+class RenderPart:
+    name: str
+    markdown: str
+    pdf_path: str = ""
+    status: str = "pending"
+    elapsed: float = 0.0
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.markdown.encode()).hexdigest()
+
+
+def split_deck(markdown: str) -> list[RenderPart]:
+    """
+    split a deck into its title part and one part per week
+    - a front matter is repeated in every part, so directives apply to all of them
+    """
+    front_matter = ""
+    match = _FRONT_MATTER_PATTERN.match(markdown)
+    if match:
+        front_matter = match.group(0)
+        markdown = markdown[match.end() :]
+
+    names = ["title"]
+    bodies = []
+    position = 0
+    for match in _PART_PATTERN.finditer(markdown):
+        bodies.append(markdown[position : match.start()])
+        names.append(match.group(1))
+        position = match.end()
+    bodies.append(markdown[position:])
+
+    parts = []
+    for name, body in zip(names, bodies):
+        body = body.strip()
+        # each part is its own document, a trailing separator would add an empty slide
+        body = body.removesuffix("---").rstrip()
+        if body:
+            parts.append(RenderPart(name=name, markdown=f"{front_matter}{body}\n"))
+    return parts
+
+
+def _run_marp(markdown_path: str, pdf_path: str):
+    subprocess.run(
+        [
+            *render_config.MARP_COMMAND.split(),
+            markdown_path,
+            "--pdf",
+            "-o",
+            pdf_path,
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+
+def _render_part(part: RenderPart, folder: str, deck_folder: str) -> RenderPart:
+    with span("render_part", "render", part=part.name) as current:
+        _render_part_pdf(part, folder, deck_folder)
+        current.set(status=part.status)
+    return part
+
+
+def _render_part_pdf(part: RenderPart, folder: str, deck_folder: str):
+    part.pdf_path = f"{folder}/{part.digest}.pdf"
+    if os.path.exists(part.pdf_path):
+        part.status = "cached"
+        return
+    start = time.perf_counter()
+    # next to the deck, so relative links resolve as they do in the deck
+    markdown_path = f"{deck_folder}/.part-{id(part)}.md"
+    with open(markdown_path, "w") as f:
+        f.write(part.markdown)
+    try:
+        # render next to the final name, so an interrupted render is never cached
+        tmp_path = f"{folder}/{id(part)}.tmp.pdf"
+        _run_marp(markdown_path, tmp_path)
+        os.replace(tmp_path, part.pdf_path)
+        part.status = "rendered"
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, "stderr", None)
+        get_logger().debug(f"Rendering {part.name} failed: {stderr or e}")
+        part.status = "failed"
+    finally:
+        os.remove(markdown_path)
+    part.elapsed = time.perf_counter() - start
+
+
+def _merge_pdfs(paths: list[str], pdf_path: str):
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(f"{pdf_path}.tmp", "wb") as f:
+        writer.write(f)
+    os.replace(f"{pdf_path}.tmp", pdf_path)
+
+
+def _prune(folder: str, keep: set[str]):
+    """
+    drop rendered parts which are not part of the current deck anymore
+    """
+    for entry in os.scandir(folder):
+        if entry.name.endswith(".pdf") and entry.path not in keep:
+            os.remove(entry.path)
+
+
+def _print_render_table(parts: list[RenderPart]):
+    table = Table(title="Rendered parts")
+    table.add_column("Part")
+    table.add_column("Status")
+    table.add_column("Time", justify="right")
+    colors = {"rendered": "green", "cached": "blue", "failed": "red"}
+    for part in parts:
+        table.add_row(
+            part.name,
+            f"[{colors[part.status]}]{part.status}[/{colors[part.status]}]",
+            f"{part.elapsed:.2f}s",
+        )
+    rich_print(table)
+
+
+def _render_whole(markdown_path: str, pdf_path: str) -> bool:
+    start = time.perf_counter()
+    try:
+        _run_marp(markdown_path, pdf_path)
+    except (OSError, subprocess.CalledProcessError) as e:
+        rich_print(f"[red]Rendering failed: {getattr(e, 'stderr', None) or e}[/red]")
+        return False
+    rich_print(f"Rendered {pdf_path} in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def render_pdf(markdown_path: str, course_name: str) -> str | None:
+    """
+    render `markdown_path` to a PDF next to it
+    :return: path of the PDF, `None` if rendering failed
+    """
+    with span("render_pdf", "render", course=course_name):
+        return _render_pdf(markdown_path, course_name)
+
+
+def _render_pdf(markdown_path: str, course_name: str) -> str | None:
+    pdf_path = f"{os.path.splitext(markdown_path)[0]}.pdf"
+    if not render_config.SPLIT:
+        return pdf_path if _render_whole(markdown_path, pdf_path) else None
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        rich_print(
+            "[yellow]pypdf is not installed, rendering the whole deck at once[/yellow]"
+        )
+        return pdf_path if _render_whole(markdown_path, pdf_path) else None
+
+    with open(markdown_path, "r") as f:
+        parts = split_deck(f.read())
+    folder = f"{cache_config.FOLDER}/render/{course_name}"
+    os.makedirs(folder, exist_ok=True)
+
+    start = time.perf_counter()
+    # marp runs in its own process, threads are enough to keep the processes busy
+    with ThreadPoolExecutor(max_workers=render_config.WORKERS) as executor:
+        parts = list(
+            executor.map(
+                bind_span(
+                    lambda part: _render_part(
+                        part, folder, os.path.dirname(markdown_path) or "."
+                    )
+                ),
+                parts,
+            )
+        )
+    _print_render_table(parts)
+
+    if any(part.status == "failed" for part in parts):
+        rich_print("[red]Some parts failed to render, run with -v for details[/red]")
+        return None
+    if len(parts) == 1:
+        shutil.copy(parts[0].pdf_path, pdf_path)
+    else:
+        _merge_pdfs([part.pdf_path for part in parts], pdf_path)
+    _prune(folder, {part.pdf_path for part in parts})
+    rendered = sum(part.status == "rendered" for part in parts)
+    rich_print(
+        f"Rendered {rendered} of {len(parts)} parts in "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+    return pdf_path
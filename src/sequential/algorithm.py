@@ -1,3 +1,16 @@
+"""
+summarize every course file into slides, without a vector database
+- with `--async-generate` files are summarized concurrently, at most
+  `sequential_config.FILE_WORKERS` at a time, otherwise one after the other
+- a file longer than `sequential_config.CHUNK_TOKENS` is read in chunks, each chunk is
+  summarized concurrently (map) and the notes are merged into one slide (reduce)
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import AsyncIterator, Iterator
+
 from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
@@ -7,15 +20,100 @@ from langchain_core.output_parsers import StrOutputParser
 
 
 from src.algorithm import BaseAlgorithm
+from src.rag.context import count_tokens
 from src.rag.core import get_llm
+from src.rag.cache import prompt_scope
+from src.rag.prompts import get_prompt_template
 from src.log import rich_print
+from src.config import runtime_config, sequential_config
+from src.tracing import span
 
 from src.schema import (
     Course,
     CourseFile,
+    CourseResult,
+    CourseWeekItemResult,
+    CourseWeekResult,
     KeyPoint,
 )
 
+NOTES_SEPARATOR = "\n\n---\n\n"
+
+
+def _split_line(line: str, max_tokens: int) -> Iterator[str]:
+    """
+    split a line longer than `max_tokens`, e.g. a whole HTML page, on spaces
+    """
+    words = []
+    used = 0
+    for word in line.split(" "):
+        tokens = count_tokens(word) + 1
+        if words and used + tokens > max_tokens:
+            yield " ".join(words) + " "
+            words = []
+            used = 0
+        words.append(word)
+        used += tokens
+    if words:
+        yield " ".join(words)
+
+
+def read_chunks(path: str, max_tokens: int) -> Iterator[str]:
+    """
+    read a file line by line into chunks of at most about `max_tokens` tokens,
+    so a file is never held in memory or in a prompt as a whole
+    """
+    lines = []
+    used = 0
+    with open(path, "r") as f:
+        for line in f:
+            tokens = count_tokens(line)
+            pieces = [(line, tokens)]
+            if tokens > max_tokens:
+                pieces = [
+                    (piece, count_tokens(piece))
+                    for piece in _split_line(line, max_tokens)
+                ]
+            for piece, tokens in pieces:
+                if lines and used + tokens > max_tokens:
+                    yield "".join(lines)
+                    lines = []
+                    used = 0
+                lines.append(piece)
+                used += tokens
+    if lines:
+        yield "".join(lines)
+
+
+async def _aread_chunks(path: str, max_tokens: int) -> AsyncIterator[str]:
+    """
+    `read_chunks` in a thread, so reading a long file does not block the event loop
+    """
+    chunks = read_chunks(path, max_tokens)
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        yield chunk
+
+
+def _group_notes(notes: list[str], max_tokens: int) -> list[list[str]]:
+    """
+    group consecutive notes into groups of at most `max_tokens` tokens,
+    with at least two notes per group so every reduce round shrinks the notes
+    """
+    groups = []
+    group = []
+    used = 0
+    for note in notes:
+        tokens = count_tokens(note)
+        if len(group) >= 2 and used + tokens > max_tokens:
+            groups.append(group)
+            group = []
+            used = 0
+        group.append(note)
+        used += tokens
+    if group:
+        groups.append(group)
+    return groups
+
 
 class SequentialAlgorithm(BaseAlgorithm):
     slide_template_prompt: ChatPromptTemplate | None = None
@@ -45,11 +143,89 @@ class SequentialAlgorithm(BaseAlgorithm):
     def delete_course(self) -> None:
         rich_print("[red]Sequential algorithm does not support deleting courses [/red]")
 
+    def _generate_course(self):
+        # one event loop for the whole course, the async OpenAI client is bound to the
+        # loop it was first used in
+        asyncio.run(self._agenerate_course())
+
     def _generate_course_file(self, course_file: CourseFile) -> KeyPoint:
-        file_content = open(course_file.path, "r").read()
-        rich_print(f"Generating slides for {course_file.path}...")
+        """
+        generate a single file, the course is generated by `_agenerate_course`
+        """
+        return asyncio.run(self._agenerate_course_file(course_file))
+
+    async def _agenerate_course(self):
+        """
+        headers are added and slots reserved in course order, the files of all weeks
+        are scheduled as tasks and awaited at the end
+        - without `--async-generate` the files take the only slot one after the other,
+          the chunks of a long file are still summarized concurrently
+        """
+        workers = sequential_config.FILE_WORKERS if runtime_config.ASYNC_GENERATE else 1
+        self._file_slots = asyncio.Semaphore(max(1, workers))
+        weeks = []
+        pending = []
+        for course_week in self.course_source.weeks:
+            self._aggregate_week_header(course_week.name, None)
+            items = []
+            for course_week_item in course_week.items:
+                self._aggregate_header(f"## {course_week_item.name}", None)
+                tasks = [
+                    asyncio.create_task(
+                        self._agenerate_slot(course_file, self.aggregator.reserve())
+                    )
+                    for course_file in course_week_item.items
+                ]
+                week_item_result = CourseWeekItemResult(
+                    name=course_week_item.name, toc=None, items=[]
+                )
+                pending.append((week_item_result, tasks))
+                items.append(week_item_result)
+            weeks.append(CourseWeekResult(name=course_week.name, toc=None, items=items))
+
+        for week_item_result, tasks in pending:
+            week_item_result.items = list(await asyncio.gather(*tasks))
+        self.course_result = CourseResult(
+            name=self.course_source.name, toc=None, weeks=weeks
+        )
+
+    async def _agenerate_slot(self, course_file: CourseFile, slot: int) -> KeyPoint:
+        async with self._file_slots:
+            key_point = await self._agenerate_course_file(course_file)
+        self._aggregate_key_point(slot, key_point)
+        return key_point
+
+    def _get_final_path(self, course_file: CourseFile) -> str:
+        """
+        mirror the course tree, files of different week items often share a name
+        """
+        relative_path = os.path.relpath(course_file.path, self.course_source.path)
+        folder, file_name = os.path.split(relative_path)
+        # replace the file extensions with .md
+        file_name = file_name.split(".")[0] + ".md"
+        return os.path.normpath(f"{self.dist_dir}/{folder}/{file_name}")
+
+    async def _agenerate_course_file(self, course_file: CourseFile) -> KeyPoint:
+        checkpoint_key = f"course_file/{course_file.path}"
+        finished_key_point = self.checkpoint.get_key_point(checkpoint_key)
+        if finished_key_point is not None:
+            rich_print(f"Skipping finished slides for {course_file.path}")
+            return finished_key_point
+        final_path = self._get_final_path(course_file)
+        file_name = os.path.basename(final_path)
         try:
-            result = self.chain.invoke({"text": file_content})
+            rich_print(f"Generating slides for {course_file.path}...")
+            with span("course_file", "slide", path=course_file.path):
+                text = await self._amap_reduce(course_file)
+                if runtime_config.STREAM:
+                    await self._astream_result_to_file(
+                        self.chain.astream({"text": text}), final_path, file_name
+                    )
+                else:
+                    result = await self._ainvoke(text, "sequential_slide_prompt")
+                    rich_print(f"Generated result: {result}")
+                    self.logger.debug(f"Writing to {final_path}")
+                    self._write_result_to_file(result, final_path)
         except Exception as e:
             rich_print(f"[red]Error during generation: {e}[/red]")
             return KeyPoint(
@@ -57,17 +233,77 @@ class SequentialAlgorithm(BaseAlgorithm):
                 path=course_file.path,
                 type="error",
             )
-        rich_print(f"Generated result: {result}")
-        # get the file name
-        file_name = course_file.path.split("/")[-1]
-        # replace the file extension with .md
-        file_name = file_name.split(".")[0] + ".md"
-        final_path = f"{self.dist_dir}/{file_name}"
-        self.logger.debug(f"Writing to {final_path}")
-        self._write_result_to_file(result, final_path)
 
-        return KeyPoint(
+        key_point = KeyPoint(
             name=file_name,
             path=final_path,
             type="concept",
         )
+        self.checkpoint.complete_key_point(checkpoint_key, key_point)
+        return key_point
+
+    async def _ainvoke(self, text: str, prompt_name: str) -> str:
+        """
+        invoke the chain, cached responses are tagged with `prompt_name`
+        """
+        with prompt_scope(prompt_name), span(prompt_name, "chain"):
+            return await self.chain.ainvoke({"text": text})
+
+    async def _amap_reduce(self, course_file: CourseFile) -> str:
+        """
+        :return: the prompt of the slide, the file itself when it fits in one chunk,
+        otherwise the reduce prompt of its summarized chunks
+        """
+        max_tokens = sequential_config.CHUNK_TOKENS
+        first = None
+        tasks = []
+        # the map requests start while the rest of the file is read
+        async for chunk in _aread_chunks(course_file.path, max_tokens):
+            if first is None:
+                first = chunk
+                continue
+            if not tasks:
+                tasks.append(asyncio.create_task(self._amap(course_file, 1, first)))
+            tasks.append(
+                asyncio.create_task(self._amap(course_file, len(tasks) + 1, chunk))
+            )
+        if not tasks:
+            return first or ""
+
+        notes = list(await asyncio.gather(*tasks))
+        self.logger.debug(f"Summarized {course_file.path} in {len(notes)} chunks")
+
+        # merge the notes until they fit into the prompt of the slide
+        while len(notes) > 1 and count_tokens(NOTES_SEPARATOR.join(notes)) > max_tokens:
+            notes = list(
+                await asyncio.gather(
+                    *(
+                        self._ainvoke(
+                            self._format_reduce(group), "sequential_reduce_prompt"
+                        )
+                        for group in _group_notes(notes, max_tokens)
+                    )
+                )
+            )
+        return self._format_reduce(notes)
+
+    async def _amap(self, course_file: CourseFile, part: int, chunk: str) -> str:
+        # a chunk of another size or of a changed file is summarized again
+        digest = hashlib.sha256(chunk.encode()).hexdigest()[:16]
+        checkpoint_key = f"map/{course_file.path}/{part}/{digest}"
+        notes = self.checkpoint.get_response(checkpoint_key)
+        if notes is None:
+            notes = await self._ainvoke(
+                get_prompt_template("sequential_map_prompt").format(
+                    part=part, text=chunk
+                ),
+                "sequential_map_prompt",
+            )
+            self.checkpoint.set_response(checkpoint_key, notes)
+        return notes
+
+    @staticmethod
+    def _format_reduce(notes: list[str]) -> str:
+        return get_prompt_template("sequential_reduce_prompt").format(
+            notes=NOTES_SEPARATOR.join(notes)
+        )
@@ -1,12 +1,21 @@
+import os
 import time
 import importlib
 
-from src.config import coursera_config, chroma_config, langchain_config, runtime_config
+from src.config import (
+    coursera_config,
+    chroma_config,
+    context_config,
+    numpy_store_config,
+    langchain_config,
+    runtime_config,
+)
 from src.parser import get_course as parser_get_course
 from src.log import rich_print, get_logger
 from src.algorithm import BaseAlgorithm
 from src.enums import AlgorithmEnum
 from src.schema import Course, CourseResult
+from src.tracing import span
 
 
 class CourseAgent:
@@ -23,9 +32,16 @@ class CourseAgent:
         # set up configuration
         self.course_name = course_name
         self.course_source = CourseAgent.get_course_info(course_name)
-        self.timestamp = f"{course_name}-{time.strftime('%Y-%m-%d-%H-%M-%S')}"
         self.src_dir = f"{coursera_config.INPUT_ROOT_FOLDER}/{self.course_name}"
-        self.dist_dir = f"{coursera_config.RESULT_ROOT_FOLDER}/{self.timestamp}"
+        if runtime_config.RESUME_DIR:
+            # reuse the dist_dir of the interrupted run, it holds the checkpoint
+            self.dist_dir = runtime_config.RESUME_DIR.rstrip("/")
+            if not os.path.isdir(self.dist_dir):
+                raise FileNotFoundError(f"Resume directory not found: {self.dist_dir}")
+            self.timestamp = os.path.basename(self.dist_dir)
+        else:
+            self.timestamp = f"{course_name}-{time.strftime('%Y-%m-%d-%H-%M-%S')}"
+            self.dist_dir = f"{coursera_config.RESULT_ROOT_FOLDER}/{self.timestamp}"
         self.final_file_path = f"{self.dist_dir}/final-{self.timestamp}.md"
         self.logger = get_logger()
         # load module dynamically
@@ -49,21 +65,58 @@ class CourseAgent:
         rich_print(coursera_config)
         logger.info("Chroma:")
         rich_print(chroma_config)
+        logger.info("Numpy store:")
+        rich_print(numpy_store_config)
         logger.info("Langchain:")
         rich_print(langchain_config)
+        logger.info("Context packing:")
+        rich_print(context_config)
 
     @staticmethod
     def get_course_info(course_name: str) -> Course:
         return parser_get_course(f"{coursera_config.INPUT_ROOT_FOLDER}/{course_name}")
 
+    def close(self):
+        self.algorithm.close()
+
     def load_course(self):
-        self.algorithm.load_course()
+        with span("load_course", "course", course=self.course_name):
+            self.algorithm.load_course()
 
     def delete_course(self):
-        self.algorithm.delete_course()
+        with span("delete_course", "course", course=self.course_name):
+            self.algorithm.delete_course()
 
     def summarize_course(self):
-        self.algorithm.summarize_course()
+        from src.rag.cache import get_context_cache, get_response_cache
+        from src.rag.context import get_context_packer
+
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            for prompt_name in runtime_config.INVALIDATE_PROMPTS:
+                deleted = response_cache.invalidate(prompt_name)
+                rich_print(
+                    f"Invalidated {deleted} cached [bold]{prompt_name}[/bold] responses"
+                )
+
+        with span("summarize_course", "course", course=self.course_name):
+            self.algorithm.summarize_course()
+
+        if response_cache is not None:
+            rich_print(
+                f"LLM response cache: {response_cache.hits} hits, {response_cache.misses} misses"
+            )
+        context_cache = get_context_cache()
+        if context_cache.hits or context_cache.misses:
+            rich_print(
+                f"Retrieval context cache: {context_cache.hits} hits, {context_cache.misses} misses"
+            )
+        context_packer = get_context_packer()
+        if context_packer.calls:
+            rich_print(
+                f"Context packing: {context_packer.tokens_saved} of {context_packer.tokens_in} "
+                f"tokens saved over {context_packer.calls} retrievals"
+            )
 
     def get_summarize_course_result(self) -> CourseResult:
         return self.algorithm.get_summarize_course_result()
@@ -0,0 +1,463 @@
+"""
+span based tracing of a run
+- spans record wall time and attributes, e.g. tokens, retrieved documents or cache hits
+- enabled by `--trace <file>`, which writes a Chrome trace (chrome://tracing, Perfetto),
+  or by `COURSERA_TRACE_OTLP_ENDPOINT`, which exports the spans to an OTLP collector
+- a summary per span name is printed at the end of the run
+- disabled tracing costs one attribute lookup per span
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List
+from uuid import UUID
+
+from rich.table import Table
+
+from src.config import runtime_config, trace_config
+from src.log import get_logger, rich_print
+
+if TYPE_CHECKING:
+    from langchain_core.callbacks import BaseCallbackHandler
+
+# USD per 1K input and output tokens, the longest matching model prefix is used
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+    "text-embedding-3-small": (0.00002, 0.0),
+    "text-embedding-3-large": (0.00013, 0.0),
+    "text-embedding-ada-002": (0.0001, 0.0),
+}
+
+
+def get_cost(model: str | None, tokens_in: int, tokens_out: int) -> float:
+    prices = None
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(prefix):
+            prices = MODEL_PRICES[prefix]
+            break
+    if prices is None:
+        return 0.0
+    return (tokens_in * prices[0] + tokens_out * prices[1]) / 1000
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    id: int
+    parent_id: int | None
+    lane: int
+    start: float
+    end: float | None = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def add(self, key: str, value: float):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans: List[Span] = []
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.lane_names: Dict[int, str] = {}
+        # wall clock of `perf_counter() == 0`, to export absolute timestamps
+        self._epoch = time.time() - time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lanes: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _get_lane(self) -> int:
+        """
+        a lane per thread and asyncio task, so spans of concurrent tasks do not overlap
+        """
+        thread = threading.current_thread()
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = (thread.ident, id(task) if task is not None else None)
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = len(self._lanes) + 1
+                self._lanes[key] = lane
+                name = thread.name
+                if task is not None:
+                    name = f"{name} / {task.get_name()}"
+                self.lane_names[lane] = name
+            return lane
+
+    def start_span(
+        self, name: str, category: str, parent: Span | None = None, **attributes
+    ) -> Span:
+        if parent is None:
+            parent = _current_span.get()
+        return Span(
+            name=name,
+            category=category,
+            id=next(self._ids),
+            parent_id=parent.id if parent is not None else None,
+            lane=self._get_lane(),
+            start=time.perf_counter(),
+            attributes=attributes,
+        )
+
+    def end_span(self, span: Span, error: BaseException | None = None):
+        span.end = time.perf_counter()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, name: str, value: int = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+        span = _current_span.get()
+        if span is not None:
+            span.add(name, value)
+
+
+tracer = Tracer()
+
+
+def enable_tracing():
+    tracer.enabled = True
+
+
+@contextmanager
+def span(name: str, category: str = "app", **attributes):
+    """
+    record the block as a span, nested under the current span of the task
+    """
+    if not tracer.enabled:
+        yield _NOOP_SPAN
+        return
+    current = tracer.start_span(name, category, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        tracer.end_span(current, e)
+        raise
+    else:
+        tracer.end_span(current)
+    finally:
+        _current_span.reset(token)
+
+
+def bind_span(func):
+    """
+    run `func` under the current span, for functions handed to a thread pool,
+    whose threads do not inherit the context of the caller
+    """
+    if not tracer.enabled:
+        return func
+    parent = _current_span.get()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+
+    return wrapper
+
+
+def count(name: str, value: int = 1):
+    """
+    count an event, e.g. a cache hit, on the current span and in the run totals
+    """
+    tracer.count(name, value)
+
+
+@functools.cache
+def _get_callback_handler() -> "BaseCallbackHandler":
+    """
+    created on first use, so `info` and `check` never import LangChain
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.outputs import LLMResult
+
+    class TracingCallbackHandler(BaseCallbackHandler):
+        """
+        record LLM runs of LangChain as spans, with token usage and cost
+        """
+
+        # run in the task of the call, so spans are nested under the current span
+        run_inline = True
+
+        def __init__(self) -> None:
+            self._runs: Dict[UUID, Span] = {}
+
+        def _start(self, run_id: UUID, name: str, category: str, **attributes):
+            if tracer.enabled:
+                self._runs[run_id] = tracer.start_span(name, category, **attributes)
+
+        def _end(self, run_id: UUID, error: BaseException | None = None) -> Span | None:
+            span = self._runs.pop(run_id, None)
+            if span is not None:
+                tracer.end_span(span, error)
+            return span
+
+        def on_chat_model_start(
+            self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any
+        ):
+            model = (kwargs.get("invocation_params") or {}).get("model_name") or (
+                kwargs.get("invocation_params") or {}
+            ).get("model")
+            self._start(run_id, "llm", "llm", model=model)
+
+        def on_llm_start(
+            self, serialized: Dict[str, Any], prompts, *, run_id: UUID, **kwargs: Any
+        ):
+            model = (kwargs.get("invocation_params") or {}).get("model_name")
+            self._start(run_id, "llm", "llm", model=model)
+
+        def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+            span = self._end(run_id)
+            if span is None:
+                return
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            tokens_in = usage.get("prompt_tokens") or 0
+            tokens_out = usage.get("completion_tokens") or 0
+            cached = False
+            if not usage:
+                # streamed and cached responses carry the usage on the message
+                for generations in response.generations:
+                    for generation in generations:
+                        metadata = getattr(
+                            getattr(generation, "message", None), "usage_metadata", None
+                        )
+                        if metadata:
+                            tokens_in += metadata.get("input_tokens", 0)
+                            tokens_out += metadata.get("output_tokens", 0)
+                            # LangChain zeroes the cost of responses answered by the cache
+                            cached = cached or metadata.get("total_cost") == 0
+            span.set(tokens_in=tokens_in, tokens_out=tokens_out, cached=cached)
+            if not cached:
+                span.set(
+                    cost=get_cost(span.attributes.get("model"), tokens_in, tokens_out)
+                )
+
+        def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+            self._end(run_id, error)
+
+    return TracingCallbackHandler()
+
+
+def get_callbacks() -> List["BaseCallbackHandler"]:
+    """
+    callbacks for LangChain models and runnables, empty while tracing is disabled
+    """
+    return [_get_callback_handler()] if tracer.enabled else []
+
+
+def _write_chrome_trace(path: str):
+    pid = os.getpid()
+    events = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": pid,
+            "tid": lane,
+            "args": {"name": name},
+        }
+        for lane, name in tracer.lane_names.items()
+    ]
+    for span in tracer.spans:
+        args = dict(span.attributes)
+        if span.error:
+            args["error"] = span.error
+        events.append(
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start + tracer._epoch) * 1e6,
+                "dur": span.duration * 1e6,
+                "pid": pid,
+                "tid": span.lane,
+                "args": args,
+            }
+        )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {"traceEvents": events, "otherData": {"counters": tracer.counters}},
+            f,
+            default=str,
+        )
+    rich_print(f"Trace written to [bold]{path}[/bold], open it in chrome://tracing")
+
+
+def _export_otlp(endpoint: str):
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+            InMemorySpanExporter,
+        )
+        from opentelemetry.trace import Status, StatusCode, set_span_in_context
+    except ImportError:
+        rich_print(
+            "[yellow]opentelemetry-sdk and opentelemetry-exporter-otlp are needed "
+            "for the OTLP export[/yellow]"
+        )
+        return
+
+    # the spans are replayed with their recorded times, then sent in one request
+    memory = InMemorySpanExporter()
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": trace_config.SERVICE_NAME})
+    )
+    provider.add_span_processor(SimpleSpanProcessor(memory))
+    otel_tracer = provider.get_tracer("coursera-agent")
+
+    def to_ns(seconds: float) -> int:
+        return int((seconds + tracer._epoch) * 1e9)
+
+    # parents start before their children
+    otel_spans = {}
+    for span in sorted(tracer.spans, key=lambda span: span.start):
+        parent = otel_spans.get(span.parent_id)
+        otel_span = otel_tracer.start_span(
+            span.name,
+            context=set_span_in_context(parent) if parent is not None else None,
+            start_time=to_ns(span.start),
+            attributes={
+                "category": span.category,
+                **{
+                    key: value
+                    for key, value in span.attributes.items()
+                    if isinstance(value, (str, bool, int, float))
+                },
+            },
+        )
+        if span.error:
+            otel_span.set_status(Status(StatusCode.ERROR, span.error))
+        otel_spans[span.id] = otel_span
+    for span in tracer.spans:
+        otel_spans[span.id].end(end_time=to_ns(span.end))
+
+    exporter = OTLPSpanExporter(
+        endpoint=endpoint, insecure=True, timeout=trace_config.OTLP_TIMEOUT
+    )
+    result = exporter.export(memory.get_finished_spans())
+    exporter.shutdown()
+    provider.shutdown()
+    if result == SpanExportResult.SUCCESS:
+        rich_print(f"Exported {len(tracer.spans)} spans to [bold]{endpoint}[/bold]")
+    else:
+        rich_print(f"[yellow]Cannot export the spans to {endpoint}[/yellow]")
+
+
+def print_trace_summary():
+    groups: Dict[tuple, List[Span]] = defaultdict(list)
+    for span in tracer.spans:
+        groups[(span.category, span.name)].append(span)
+
+    table = Table(title="Trace summary")
+    table.add_column("Span", no_wrap=True)
+    table.add_column("Count", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Mean", justify="right")
+    table.add_column("Max", justify="right")
+    table.add_column("Tokens", justify="right")
+    table.add_column("Cost", justify="right")
+    table.add_column("Errors", justify="right")
+    ordered = sorted(
+        groups.items(),
+        key=lambda item: sum(span.duration for span in item[1]),
+        reverse=True,
+    )
+    for (category, name), spans in ordered:
+        durations = [span.duration for span in spans]
+        tokens_in = sum(span.attributes.get("tokens_in") or 0 for span in spans)
+        tokens_out = sum(span.attributes.get("tokens_out") or 0 for span in spans)
+        cost = sum(span.attributes.get("cost") or 0 for span in spans)
+        table.add_row(
+            f"{category}/{name}",
+            str(len(spans)),
+            f"{sum(durations):.2f}s",
+            f"{sum(durations) / len(durations):.2f}s",
+            f"{max(durations):.2f}s",
+            f"{tokens_in}/{tokens_out}" if tokens_in or tokens_out else "",
+            f"${cost:.4f}" if cost else "",
+            str(sum(span.error is not None for span in spans) or ""),
+        )
+    rich_print(table)
+    if tracer.counters:
+        rich_print(
+            ", ".join(
+                f"{name}: {value}" for name, value in sorted(tracer.counters.items())
+            )
+        )
+    total_cost = sum(span.attributes.get("cost") or 0 for span in tracer.spans)
+    if total_cost:
+        rich_print(f"Estimated cost of the run: [bold]${total_cost:.4f}[/bold]")
+
+
+def finish_tracing():
+    """
+    write the trace file, export to OTLP and print the summary, once at the end of a run
+    """
+    if not tracer.enabled:
+        return
+    try:
+        if runtime_config.TRACE_FILE:
+            _write_chrome_trace(runtime_config.TRACE_FILE)
+        if trace_config.OTLP_ENDPOINT:
+            _export_otlp(trace_config.OTLP_ENDPOINT)
+    except Exception as e:
+        get_logger().warning(f"Cannot export the trace: {e}")
+    print_trace_summary()
+
+
+def setup_tracing():
+    """
+    enable tracing when a trace file or an OTLP endpoint is configured
+    """
+    if runtime_config.TRACE_FILE or trace_config.OTLP_ENDPOINT:
+        enable_tracing()
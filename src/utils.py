@@ -1,4 +1,4 @@
-def parse_markdown_list(self, markdown: str) -> list[str]:
+def parse_markdown_list(markdown: str) -> list[str]:
     """
     input example:
     ```
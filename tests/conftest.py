@@ -0,0 +1,128 @@
+"""
+shared fixtures, a course in a temporary folder and a stub OpenAI server
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.config import cache_config, coursera_config, numpy_store_config
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    """
+    answers chat completions, streamed or not, and embeddings
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: str, content_type: str = "application/json"):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/embeddings"):
+            texts = (
+                body["input"] if isinstance(body["input"], list) else [body["input"]]
+            )
+            data = [
+                {"object": "embedding", "index": index, "embedding": [0.1] * 8}
+                for index in range(len(texts))
+            ]
+            usage = {"prompt_tokens": 1, "total_tokens": 1}
+            return self._send(
+                json.dumps(
+                    {
+                        "object": "list",
+                        "data": data,
+                        "model": body["model"],
+                        "usage": usage,
+                    }
+                )
+            )
+        text = "- first point\n- second point"
+        if body.get("stream"):
+            chunks = [
+                {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"role": "assistant", "content": text},
+                            "finish_reason": None,
+                        }
+                    ],
+                },
+                {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                },
+            ]
+            events = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+            return self._send(events + "data: [DONE]\n\n", "text/event-stream")
+        return self._send(
+            json.dumps(
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 10,
+                        "completion_tokens": 5,
+                        "total_tokens": 15,
+                    },
+                }
+            )
+        )
+
+
+@pytest.fixture
+def openai_stub(monkeypatch):
+    """
+    point the OpenAI clients at a local stub server
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    input, output, caches and the numpy store in a temporary folder
+    """
+    monkeypatch.setattr(coursera_config, "INPUT_ROOT_FOLDER", str(tmp_path / "input"))
+    monkeypatch.setattr(coursera_config, "RESULT_ROOT_FOLDER", str(tmp_path / "output"))
+    monkeypatch.setattr(cache_config, "FOLDER", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_config, "EMBEDDING_CACHE", False)
+    monkeypatch.setattr(cache_config, "LLM_CACHE", False)
+    monkeypatch.setattr(numpy_store_config, "FOLDER", str(tmp_path / "numpy"))
+    return tmp_path
@@ -0,0 +1,27 @@
+import asyncio
+
+from benchmarks.fakes import FakeEmbeddings
+from src.rag.embedding import CachedEmbeddings
+from src.tracing import tracer
+
+
+def test_query_lookups_are_counted(tmp_path, monkeypatch):
+    counted = []
+    monkeypatch.setattr(tracer, "count", lambda name, value=1: counted.append(name))
+    embeddings = CachedEmbeddings(
+        FakeEmbeddings(size=8, latency=0),
+        cache_path=str(tmp_path / "embeddings.sqlite3"),
+        max_bytes=1024 * 1024,
+    )
+
+    embeddings.embed_query("loops")
+    embeddings.embed_query("loops")
+    asyncio.run(embeddings.aembed_query("loops"))
+    asyncio.run(embeddings.aembed_query("lists"))
+
+    assert counted == [
+        "embedding_cache_misses",
+        "embedding_cache_hits",
+        "embedding_cache_hits",
+        "embedding_cache_misses",
+    ]
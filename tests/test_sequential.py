@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.course import CourseShape, make_course
+from src.config import coursera_config, runtime_config
+from src.enums import AlgorithmEnum
+
+COURSE_NAME = "test-course"
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_sync_generate_uses_one_event_loop(workdir, openai_stub, monkeypatch, stream):
+    monkeypatch.setattr(runtime_config, "ALGORITHM", AlgorithmEnum.SEQUENTIAL.value)
+    monkeypatch.setattr(runtime_config, "ASYNC_GENERATE", False)
+    monkeypatch.setattr(runtime_config, "STREAM", stream)
+    make_course(
+        coursera_config.INPUT_ROOT_FOLDER,
+        COURSE_NAME,
+        CourseShape(weeks=1, items=2, files=2, file_kb=1),
+    )
+    from src.service import CourseAgent
+
+    agent = CourseAgent(course_name=COURSE_NAME)
+    try:
+        agent.summarize_course()
+        course_result = agent.get_summarize_course_result()
+    finally:
+        agent.close()
+
+    key_points = [
+        key_point
+        for week in course_result.weeks
+        for item in week.items
+        for key_point in item.items
+    ]
+    assert len(key_points) == 4
+    assert all(key_point.type != "error" for key_point in key_points)
@@ -0,0 +1,52 @@
+import os
+import socket
+
+import pytest
+
+from benchmarks.course import CourseShape, make_course
+from src.config import chroma_config, coursera_config, runtime_config
+from src.enums import AlgorithmEnum, StorageEnum
+from src.rag.manifest import CollectionManifest
+from src.rag.numpy_store import numpy_collection_exists
+from src.rag.vector_database import add_embeddings, flush_embeddings
+
+COURSE_NAME = "test-course"
+
+
+@pytest.fixture
+def no_chroma(monkeypatch):
+    """
+    point the Chroma client at a port nothing listens on
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(chroma_config, "HOST", "127.0.0.1")
+    monkeypatch.setattr(chroma_config, "PORT", port)
+
+
+def test_numpy_delete_needs_no_chroma(workdir, no_chroma, monkeypatch):
+    monkeypatch.setattr(runtime_config, "ALGORITHM", AlgorithmEnum.RAG.value)
+    monkeypatch.setattr(runtime_config, "STORAGE", StorageEnum.NUMPY)
+    monkeypatch.setattr("builtins.input", lambda: "y")
+    make_course(
+        coursera_config.INPUT_ROOT_FOLDER,
+        COURSE_NAME,
+        CourseShape(weeks=1, items=1, files=1, file_kb=1),
+    )
+    from src.service import CourseAgent
+
+    agent = CourseAgent(course_name=COURSE_NAME)
+    collection_name = agent.algorithm.collection_name
+    add_embeddings(collection_name, ["a"], ["text"], [[0.1] * 8], [{"source": "a"}])
+    flush_embeddings(collection_name)
+    assert numpy_collection_exists(collection_name)
+    manifest = CollectionManifest(collection_name=collection_name)
+    manifest.save()
+    try:
+        agent.delete_course()
+    finally:
+        agent.close()
+
+    assert not numpy_collection_exists(collection_name)
+    assert not os.path.exists(CollectionManifest.get_path(collection_name))